@@ -1,5 +1,9 @@
-import os, re, time, json, hashlib, requests, sys
-#import threading
+import os, re, time, json, hashlib, requests, sys, sqlite3, zlib
+import threading
+import db_access
+import db_schema
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime
 from datetime import date
 
@@ -48,6 +52,25 @@ def util_variables(xbmc_flag):
 		TMDB_API_KEY = kodi_stub.get_setting(setting_name = 'tmdb_api_key', var_type = 'string', SETTING_XML=SETTING_XML)
 	return xbmc_flag
 
+def get_addon_setting(setting_name, var_type='string', default=None):
+	if xbmc_flag:
+		value = ADDON.getSetting(setting_name)
+	else:
+		import kodi_stub
+		value = kodi_stub.get_setting(setting_name = setting_name, var_type = 'string', SETTING_XML=SETTING_XML)
+	if value in (None, '', 'None'):
+		return default
+	try:
+		if var_type == 'int':
+			return int(float(value))
+		elif var_type == 'float':
+			return float(value)
+		elif var_type == 'bool':
+			return str(value).lower() == 'true'
+	except ValueError:
+		return default
+	return value
+
 
 def folder_exists(folder_path):
 	if not os.path.exists(folder_path):
@@ -86,7 +109,7 @@ def log_to_kodi(msg):
 db_con = None
 def test_db():
 	import sqlite3
-	db_con = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+	db_con = sqlite3.connect(CACHE_PATH, check_same_thread=False, cached_statements=256)
 	return db_con
 
 def encode_db(sample_string):
@@ -103,6 +126,23 @@ def decode_db(base64_string):
 	sample_string = sample_string_bytes.decode("ascii")
 	return sample_string
 
+CACHE_FORMAT = db_schema.CACHE_FORMAT
+
+def encode_cache(sample_string):
+	return sqlite3.Binary(zlib.compress(sample_string.encode('utf-8'), 6))
+
+def decode_cache(cache_val, cache_type, cache_format=CACHE_FORMAT):
+	if cache_format == 0:
+		sample_string = decode_db(cache_val)
+	else:
+		sample_string = zlib.decompress(cache_val).decode('utf-8')
+	if cache_type == 'str':
+		return sample_string
+	elif cache_type == 'list':
+		return eval(sample_string)
+	elif cache_type == 'json':
+		return json.loads(sample_string)
+
 def clear_db(connection=None,table_name=None):
 	if db_con == None:
 		connection = db_start()
@@ -140,43 +180,18 @@ def write_db(connection=None,url=None, cache_days=7.0, folder=False,cache_val=No
 	hashed_url = hashlib.md5(url).hexdigest()
 	cache_seconds = int(cache_days * 86400.0)
 	if isinstance(cache_val, str) == True:
-		cache_val = encode_db(cache_val)
+		cache_val = encode_cache(cache_val)
 		cache_type = 'str'
 	elif isinstance(cache_val, list) == True or isinstance(cache_val, dict) == True:
 		try: 
-			cache_val = encode_db(json.dumps(cache_val))
+			cache_val = encode_cache(json.dumps(cache_val))
 			cache_type = 'json'
 		except: 
-			cache_val = encode_db(str(cache_val))
+			cache_val = encode_cache(str(cache_val))
 			cache_type = 'list'
 
 	expire = round(time.time() + cache_seconds,0)
-	sql_query = """
-	CREATE TABLE IF NOT EXISTS %s (
-		url VARCHAR PRIMARY KEY,
-		cache_val BLOB NOT NULL,
-		cache_type VARCHAR NOT NULL,
-		expire INT NOT NULL
-	); 
-	""" % (folder)
-	sql_result = cur.execute(sql_query).fetchall()
-	try: 
-		connection.commit()
-	except:
-		connection.commit()
-	sql_query = """
-	INSERT INTO %s (url,cache_val,cache_type,expire)
-	VALUES( '%s','%s','%s',%s);
-	""" % (folder, hashed_url,cache_val,cache_type,int(expire))
-	try: 
-		sql_result = cur.execute(sql_query).fetchall()
-	except Exception as ex:
-		if 'UNIQUE constraint failed' in str(ex):
-			sql_query = """
-			REPLACE INTO %s (url,cache_val,cache_type,expire)
-			VALUES( '%s','%s','%s',%s);
-			""" % (folder, hashed_url,cache_val,cache_type,int(expire))
-			sql_result = cur.execute(sql_query).fetchall()
+	db_access.cache_replace(cur, folder, hashed_url, cache_val, cache_type, expire, CACHE_FORMAT)
 	try: 
 		connection.commit()
 	except:
@@ -184,7 +199,32 @@ def write_db(connection=None,url=None, cache_days=7.0, folder=False,cache_val=No
 		except: pass
 	cur.close()
 
-def query_db(connection=None,url=None, cache_days=7.0, folder=False, headers=False):
+MEMO_SIZE = 64
+memo_cache = OrderedDict()
+memo_lock = threading.Lock()
+
+def memo_get(folder, hashed_url, cache_seconds):
+	#in process LRU in front of query_db, entries honour the same expire rules as the DB rows
+	with memo_lock:
+		entry = memo_cache.get((folder, hashed_url))
+		if entry is None:
+			return None
+		expire, cache_val = entry
+		now = time.time()
+		if now >= expire or round(now + cache_seconds,0) < expire:
+			del memo_cache[(folder, hashed_url)]
+			return None
+		memo_cache.move_to_end((folder, hashed_url))
+		return cache_val
+
+def memo_put(folder, hashed_url, expire, cache_val):
+	with memo_lock:
+		memo_cache[(folder, hashed_url)] = (int(expire), cache_val)
+		memo_cache.move_to_end((folder, hashed_url))
+		while len(memo_cache) > MEMO_SIZE:
+			memo_cache.popitem(last=False)
+
+def query_db(connection=None,url=None, cache_days=7.0, folder=False, headers=False, memo=False):
 	if db_con == None:
 		connection = db_start()
 	cur = connection.cursor()
@@ -193,43 +233,54 @@ def query_db(connection=None,url=None, cache_days=7.0, folder=False, headers=Fal
 	cache_val = None
 	cache_seconds = int(cache_days * 86400.0)
 	hashed_url = hashlib.md5(url).hexdigest()
-
-	sql_query = """select cache_val, expire,cache_type from %s
-	where url = '%s'
-	""" % (folder, hashed_url)
-
+	if memo:
+		cache_val = memo_get(folder, hashed_url, cache_seconds)
+		if cache_val is not None:
+			cur.close()
+			return cache_val
 
 	try: 
-		sql_result = cur.execute(sql_query).fetchall()
+		sql_result = db_access.cache_select(cur, folder, hashed_url)
 	except Exception as ex:
 		if 'no such table' in str(ex):
 			return None
 		else:
 			xbmc.log(str(ex)+'===>OPENINFO', level=xbmc.LOGINFO)
-	if len(sql_result) ==0:
+			return None
+	if not sql_result:
 		cur.close()
 		return None
 
 	expire = round(time.time() + cache_seconds,0)
-	if int(time.time()) >= int(sql_result[0][1]) or expire <= int(sql_result[0][1]) :
-		sql_query = """DELETE FROM %s
-		where url = '%s'
-		""" % (folder, hashed_url)
-		sql_result = cur.execute(sql_query).fetchall()
+	if int(time.time()) >= int(sql_result[1]) or expire < int(sql_result[1]) :
+		db_access.cache_delete(cur, folder, hashed_url)
 		connection.commit()
 		cur.close()
 		return None
 	else:
-		cache_type = sql_result[0][2]
-		if cache_type == 'str':
-			cache_val = decode_db(sql_result[0][0])
-		elif cache_type == 'list':
-			cache_val = eval(decode_db(sql_result[0][0]))
-		elif cache_type == 'json':
-			cache_val = json.loads(decode_db(sql_result[0][0]))
+		cache_val = decode_cache(sql_result[0], sql_result[2], sql_result[3])
 		cur.close()
+		if memo:
+			memo_put(folder, hashed_url, sql_result[1], cache_val)
 		return cache_val
 
+def in_db(connection=None,url=None, cache_days=7.0, folder=False):
+	#cheap version of query_db which only checks for a live row, without decoding cache_val
+	if db_con == None:
+		connection = db_start()
+	connection = connection or db_con
+	try: url = url.encode('utf-8')
+	except: pass
+	hashed_url = hashlib.md5(url).hexdigest()
+	try: 
+		expire = db_access.cache_expire(connection, folder, hashed_url)
+	except Exception as ex:
+		return False
+	if expire is None:
+		return False
+	now = int(time.time())
+	return now < int(expire) <= round(now + int(cache_days * 86400.0), 0)
+
 def db_delete_expired(connection=None):
 	if db_con == None:
 		connection = db_start()
@@ -272,38 +323,141 @@ def db_delete_expired(connection=None):
 
 db_start = test_db()
 db_con = db_start
-
-def get_http(url, headers=False):
+db_schema.ensure_schema(db_con, log_to_kodi)
+
+
+class TokenBucket:
+	"""Thread safe token bucket, acquire() blocks until a request may be sent."""
+	def __init__(self, rate, capacity=None):
+		self.rate = float(rate)
+		self.capacity = float(capacity or max(1, rate))
+		self.tokens = self.capacity
+		self.last = time.monotonic()
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		if self.rate <= 0:
+			return
+		while True:
+			with self.lock:
+				now = time.monotonic()
+				self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+				self.last = now
+				if self.tokens >= 1:
+					self.tokens -= 1
+					return
+				wait = (1 - self.tokens) / self.rate
+			time.sleep(wait)
+
+def get_http_response(url, headers=False):
 	succeed = 0
 	if not headers:
 		headers = {'User-agent': 'Kodi/18.0 ( phil65@kodi.tv )'}
 	while (succeed < 2) :
 		try:
-			request = requests.get(url, headers=headers)
-			return request.text
+			return requests.get(url, headers=headers)
 		except Exception as e:
-			log('get_http: could not get data from %s' % url)
+			log_to_kodi('get_http: could not get data from %s' % tmdb_log_url(url))
 			xbmc.sleep(500)
 			succeed += 1
 	return None
 
-
-def get_tmdb_data(url='', cache_days=14, folder='TheMovieDB'):
-	url = 'https://api.themoviedb.org/3/%sapi_key=%s' % (url, TMDB_API_KEY)
-	return get_JSON_response(url, cache_days, folder)
-
+def get_http(url, headers=False):
+	response = get_http_response(url, headers)
+	if response is None:
+		return None
+	return response.text
+
+def tmdb_log_url(url):
+	#tmdb urls carry the api key, it is cut off before they are logged
+	if isinstance(url, bytes):
+		url = url.decode('utf-8')
+	return url.split('api_key=', 1)[0]
+
+def get_json(url, headers=False):
+	#decoded body of a 200 response, anything else is None
+	#TMDB answers a rate limit (429) or a bad key (401) with a json error body, that body must never reach write_db
+	response = get_http_response(url, headers)
+	if response is None:
+		return None
+	if response.status_code != 200:
+		log_to_kodi('get_json: status %s for %s' % (response.status_code, tmdb_log_url(url)))
+		return None
+	try: return response.json()
+	except ValueError: return None
+
+
+TMDB_WORKERS = get_addon_setting('tmdb_workers', 'int', 8)
+TMDB_RATE_LIMIT = get_addon_setting('tmdb_rate_limit', 'float', 40.0)
+#season payloads carry no per episode external_ids / images, so season mode drops the imdb / tvdb uniqueid and the extra still from episode NFOs
+TMDB_SEASON_MODE = get_addon_setting('tmdb_season_mode', 'bool', False)
+tmdb_limiter = TokenBucket(TMDB_RATE_LIMIT)
+
+def tmdb_url(url=''):
+	return 'https://api.themoviedb.org/3/%sapi_key=%s' % (url, TMDB_API_KEY)
+
+def get_tmdb_data(url='', cache_days=14, folder='TheMovieDB', memo=False):
+	url = tmdb_url(url)
+	return get_JSON_response(url, cache_days, folder, memo=memo)
+
+def movie_info_url(movie_id):
+	return 'movie/%s?append_to_response=credits,external_ids,release_dates,rating,alternative_titles,images&language=en&include_image_language=en&' % (movie_id)
+
+def tvshow_info_url(tvshow_id):
+	return 'tv/%s?append_to_response=credits,external_ids,content_ratings,images,rating,alternative_titles&language=en&include_image_language=en&' % (tvshow_id)
+
+def episode_info_url(tvshow_id, season, episode):
+	return 'tv/%s/season/%s/episode/%s?append_to_response=credits,external_ids,images,content_ratings,runtime,rating&language=en&include_image_language=en&' % (tvshow_id, season, episode)
+
+def season_info_url(tvshow_id, season):
+	return 'tv/%s/season/%s?append_to_response=credits&language=en&include_image_language=en&' % (tvshow_id, season)
+
+def season_episode_url(tvshow_id, season, episode):
+	#cache key for an episode record split out of a season payload, it is never requested from tmdb
+	return 'tv/%s/season/%s/episode/%s?season_mode&' % (tvshow_id, season, episode)
+
+#(tvshow_id, season) fetched this run, an episode missing from that payload goes straight to the episode endpoint
+seasons_fetched = set()
+
+def write_season_episodes(tvshow_id, season, season_info, cache_time=7):
+	#cache every episode of a tv/{id}/season/{s} payload individually, the season cast stands in for episode credits
+	if not season_info:
+		return
+	seasons_fetched.add((str(tvshow_id), str(season)))
+	cast = season_info.get('credits', {}).get('cast', [])
+	for episode_info in season_info.get('episodes', []) or []:
+		episode_info.setdefault('credits', {'cast': cast})
+		write_db(connection=db_con,url=tmdb_url(season_episode_url(tvshow_id, season, episode_info.get('episode_number'))), cache_days=cache_time, folder='TheMovieDB',cache_val=episode_info)
+
+def season_episode_info(tvshow_id, season, episode, cache_time=7):
+	url = tmdb_url(season_episode_url(tvshow_id, season, episode))
+	response = query_db(connection=db_con,url=url, cache_days=cache_time, folder='TheMovieDB')
+	if response:
+		return response
+	if (str(tvshow_id), str(season)) not in seasons_fetched:
+		tmdb_limiter.acquire()
+		season_info = get_json(tmdb_url(season_info_url(tvshow_id, season)))
+		write_season_episodes(tvshow_id, season, season_info, cache_time)
+		response = query_db(connection=db_con,url=url, cache_days=cache_time, folder='TheMovieDB')
+		if response:
+			return response
+	#episode missing from the season payload (provider numbering), fall back to the episode endpoint
+	response = get_tmdb_data(episode_info_url(tvshow_id, season, episode), cache_time)
+	if response:
+		write_db(connection=db_con,url=url, cache_days=cache_time, folder='TheMovieDB',cache_val=response)
+	return response
 
 def single_movie_info(movie_id=None, cache_time=14):
 	if not movie_id:
 		return None
 	session_str = ''
-	response = get_tmdb_data('movie/%s?append_to_response=credits,external_ids,release_dates,rating,alternative_titles,images&language=en&include_image_language=en&' % (movie_id), cache_time)
+	response = get_tmdb_data(movie_info_url(movie_id), cache_time)
 	return response
 
 def single_tvshow_info(tvshow_id=None, cache_time=7, dbid=None):
 	if not tvshow_id:
 		return None
-	response = get_tmdb_data('tv/%s?append_to_response=credits,external_ids,content_ratings,images,rating,alternative_titles&language=en&include_image_language=en&' % (tvshow_id), cache_time)
+	response = get_tmdb_data(tvshow_info_url(tvshow_id), cache_time, memo=True)
 	return response
 
 def extended_episode_info(tvshow_id, season, episode, cache_time=7):
@@ -311,30 +465,74 @@ def extended_episode_info(tvshow_id, season, episode, cache_time=7):
 		return None
 	if not season:
 		season = 0
-	tvshow = get_tmdb_data('tv/%s?append_to_response=credits,external_ids,content_ratings,images,rating,alternative_titles&language=en&include_image_language=en&' % (tvshow_id), 99999)
-	response = get_tmdb_data('tv/%s/season/%s/episode/%s?append_to_response=credits,external_ids,images,content_ratings,runtime,rating&language=en&include_image_language=en&' % (tvshow_id, season, episode), cache_time)
+	tvshow = get_tmdb_data(tvshow_info_url(tvshow_id), 99999, memo=True)
+	if TMDB_SEASON_MODE:
+		response = season_episode_info(tvshow_id, season, episode, cache_time)
+	else:
+		response = get_tmdb_data(episode_info_url(tvshow_id, season, episode), cache_time)
 	return response, tvshow
 
-def get_JSON_response(url='', cache_days=7.0, folder=False, headers=False):
+def resolve_tmdb_batch(keys, cache_time=7, workers=None):
+	"""
+	Warm the TheMovieDB cache for a batch of (kind, tmdb_id, season, episode) keys.
+	kind is 'movie', 'tv' or 'episode', cache_time matches what the single_movie_info /
+	extended_episode_info callers pass so their later lookups are cache hits.
+	Keys are deduplicated, misses fetched in parallel under tmdb_limiter and written to the DB.
+	"""
+	requests_needed = {}
+	seasons_needed = {}
+	for kind, tmdb_id, season, episode in keys:
+		if not tmdb_id:
+			continue
+		if kind == 'movie':
+			requests_needed[tmdb_url(movie_info_url(tmdb_id))] = cache_time
+		elif kind == 'tv':
+			requests_needed[tmdb_url(tvshow_info_url(tmdb_id))] = cache_time
+		elif kind == 'episode' and episode:
+			requests_needed.setdefault(tmdb_url(tvshow_info_url(tmdb_id)), 99999)
+			if not TMDB_SEASON_MODE:
+				requests_needed[tmdb_url(episode_info_url(tmdb_id, season or 0, episode))] = cache_time
+			elif not in_db(url=tmdb_url(season_episode_url(tmdb_id, season or 0, episode)), cache_days=cache_time, folder='TheMovieDB'):
+				seasons_needed[tmdb_url(season_info_url(tmdb_id, season or 0))] = (tmdb_id, season or 0)
+	misses = [(url, cache_days) for url, cache_days in requests_needed.items() if not in_db(url=url, cache_days=cache_days, folder='TheMovieDB')]
+	misses += [(url, cache_time) for url in seasons_needed]
+	if len(misses) == 0:
+		return 0
+
+	def fetch(url):
+		tmdb_limiter.acquire()
+		return get_json(url)
+
+	with ThreadPoolExecutor(max_workers=max(1, workers or TMDB_WORKERS)) as pool:
+		for (url, cache_days), results in zip(misses, pool.map(fetch, [url for url, cache_days in misses])):
+			if not results:
+				continue
+			if url in seasons_needed:
+				write_season_episodes(*seasons_needed[url], season_info=results, cache_time=cache_days)
+			else:
+				write_db(connection=db_con,url=url, cache_days=cache_days, folder='TheMovieDB',cache_val=results)
+	return len(misses)
+
+def get_JSON_response(url='', cache_days=7.0, folder=False, headers=False, memo=False):
 	now = time.time()
 	url = url.encode('utf-8')
 	hashed_url = hashlib.md5(url).hexdigest()
 	cache_seconds = int(cache_days * 86400.0)
 
 	try: 
-		db_result = query_db(connection=db_con,url=url, cache_days=cache_days, folder=folder, headers=headers)
+		db_result = query_db(connection=db_con,url=url, cache_days=cache_days, folder=folder, headers=headers, memo=memo)
 	except:
 		db_result = None
 	if db_result:
 		return db_result
 	else:
-		response = get_http(url, headers)
-		try: results = json.loads(response)
-		except: results = []
+		results = get_json(url, headers)
 	if not results or len(results) == 0:
 		return None
 	else:
 		write_db(connection=db_con,url=url, cache_days=cache_days, folder=folder,cache_val=results)
+		if memo:
+			memo_put(folder, hashed_url, round(now + cache_seconds,0), results)
 	return results
 
 
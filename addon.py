@@ -7,23 +7,31 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), 're
 # --- Standard library ---
 import re
 import json
+import hashlib
 
 import shutil
 import time
-
-from xml.etree.ElementTree import Element, SubElement, tostring
-from datetime import datetime
-
-from unidecode import unidecode
-
+import atexit
+import threading
+import heapq
+import multiprocessing
+from collections import deque, OrderedDict, namedtuple
+from functools import partial
+from itertools import islice
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
 
 import requests
 from requests_cache import CachedSession
 #from rapidfuzz import fuzz, process
 
 import Utils
+import db_access
+import records
+import catalog_diff
+import nfo
+from nfo import kodi_tvshow_nfo, kodi_season_nfo
 from Utils import log_to_kodi as log_to_kodi
-from Utils import remove_non_ascii as remove_non_ascii
 xbmc_flag = Utils.xbmc_flag
 
 
@@ -56,6 +64,7 @@ get_series_categories = f'{SERVER_ADD}/player_api.php?username={USERNAME}&passwo
 get_series_info = f'{SERVER_ADD}/player_api.php?username={USERNAME}&password={PASSWORD}&action=get_series_info'
 get_vod_categories = f'{SERVER_ADD}/player_api.php?username={USERNAME}&password={PASSWORD}&action=get_vod_categories'
 get_live_categories = f'{SERVER_ADD}/player_api.php?username={USERNAME}&password={PASSWORD}&action=get_live_categories'
+CATALOG_URLS = {'TV_SHOW': SERIES_API_URL, 'MOVIE': VOD_API_URL}
 
 
 
@@ -77,16 +86,30 @@ SERIES_INFO_CACHE_PATH = os.path.join(CACHE_DIR, 'series_info_cache.json')
 session = CachedSession(cache_name=os.path.join(CACHE_DIR,'xtream_cache'), backend='sqlite', expire_after=(60 * 60 * 24)) ##1 day
 #session_tv = CachedSession(cache_name=os.path.join(CACHE_DIR,'xtream_cache_tv'), backend='sqlite', expire_after=(60 * 60 * 24 * 14)) ##14 day
 
+SERIES_WORKERS = Utils.get_addon_setting('series_workers', 'int', 8)
+SERIES_RATE_LIMIT = Utils.get_addon_setting('series_rate_limit', 'float', 10.0)
+
+#SERVER_ADD is the only host cached_get talks to, one bucket built up front is shared by every prefetch thread
+provider_limiter = Utils.TokenBucket(SERIES_RATE_LIMIT)
+
+def cached_get(url):
+	#cache hits skip the rate limiter, only requests which go to the provider are throttled
+	response = session.get(url, only_if_cached=True)
+	if response.status_code == 504:
+		provider_limiter.acquire()
+		response = session.get(url)
+	return response
+
 def VOD_json(url, series_id=None, force_refresh=False):
 	if series_id:
 		url = get_series_info + '&series_id=%s' % str(series_id)
 		if force_refresh == True:
 			session.cache.delete_url(url)
-		response = session.get(url)
+		response = cached_get(url)
 	else:
 		if force_refresh == True:
 			session.cache.delete_url(url)
-		response = session.get(url)
+		response = cached_get(url)
 	try: status_code = response.status_code
 	except: status_code = 400
 	if status_code == 200:
@@ -94,6 +117,245 @@ def VOD_json(url, series_id=None, force_refresh=False):
 	else:
 		return []
 
+STREAM_CATALOG = Utils.get_addon_setting('stream_catalog', 'bool', False)
+
+def iter_json_array(text, decoder=json.JSONDecoder()):
+	#yield the items of a top level json array one at a time instead of building the whole list
+	idx = len(text) - len(text.lstrip())
+	if text[idx:idx + 1] != '[':
+		for i in json.loads(text) or []:
+			yield i
+		return
+	idx += 1
+	length = len(text)
+	while idx < length:
+		while idx < length and text[idx] in ' \t\r\n,':
+			idx += 1
+		if idx >= length or text[idx] == ']':
+			return
+		item, idx = decoder.raw_decode(text, idx)
+		yield item
+
+#catalog urls that failed or came back empty this run, the reconcile is skipped while any is set
+catalog_failures = set()
+JSON_ARRAY = re.compile(r'\s*\[')
+
+def catalog_name(url):
+	#the url carries the credentials, only the action goes to the log
+	return url.rsplit('action=', 1)[-1]
+
+def VOD_json_iter(url, force_refresh=False):
+	#streaming version of VOD_json for the get_vod_streams / get_series catalogs
+	if force_refresh == True:
+		session.cache.delete_url(url)
+	response = cached_get(url)
+	try: status_code = response.status_code
+	except: status_code = 400
+	if status_code != 200:
+		catalog_failures.add(url)
+		log_to_kodi(f"Catalog {catalog_name(url)} failed with status {status_code}")
+		return
+	text = response.text
+	response = None
+	if not JSON_ARRAY.match(text):
+		#a 200 carrying an object, e.g. the Xtream auth failure {"user_info":{"auth":0}}, is not a catalog
+		catalog_failures.add(url)
+		log_to_kodi(f"Catalog {catalog_name(url)} did not return a list")
+		return
+	for i in iter_json_array(text):
+		yield i
+
+def catalog_records(url, record_type, force_refresh=False):
+	#parse a catalog straight into slotted records, one provider dict at a time
+	count = 0
+	for i in VOD_json_iter(url, force_refresh):
+		if type(i) == type({}):
+			count += 1
+			yield record_type.from_json(i)
+	if count == 0 and url not in catalog_failures:
+		catalog_failures.add(url)
+		log_to_kodi(f"Catalog {catalog_name(url)} came back empty")
+
+SYNC_LIMIT = Utils.get_addon_setting('sync_limit', 'int', 0)
+
+def order_catalog(entries, sort_key, limit=0, newest_first=True):
+	"""
+	Order catalog records on an int field (added / last_modified), the key is read once per record.
+	With limit > 0 only the first limit records are kept, picked with a heap instead of sorting the whole catalog.
+	"""
+	key = attrgetter(sort_key)
+	if limit and limit > 0:
+		if newest_first:
+			return heapq.nlargest(limit, entries, key=key)
+		return heapq.nsmallest(limit, entries, key=key)
+	return sorted(entries, key=key, reverse=newest_first)
+
+INCREMENTAL_SYNC = Utils.get_addon_setting('incremental_sync', 'bool', False)
+FULL_SYNC_HOURS = Utils.get_addon_setting('full_sync_hours', 'float', 24.0)
+SYNC_KEYS = {'TV_SHOW': 'last_modified', 'MOVIE': 'added'}
+#raised by db_update as TV_SHOW / MOVIE rows are recorded, the row's updated field is the catalog sync key
+sync_watermarks = {}
+#media_type -> lowest sync key of an entry that failed this pass, the saved watermark stays below it
+watermark_holds = {}
+
+def sync_plan(media_type):
+	"""
+	Decide between a full and an incremental pass for media_type, returns (full, watermark).
+	A full pass runs when neither incremental sync nor the catalog diff is on, nothing has been synced yet or the last full pass is older than FULL_SYNC_HOURS.
+	"""
+	watermark, last_full = db_access.sync_state_get(Utils.db_con, media_type)
+	full = not (INCREMENTAL_SYNC or CATALOG_DIFF) or watermark is None or time.time() - last_full >= FULL_SYNC_HOURS * 3600
+	sync_watermarks[media_type] = watermark or 0
+	if full:
+		log_to_kodi(f"{media_type} sync: full")
+		return True, 0
+	log_to_kodi(f"{media_type} sync: incremental since {watermark}")
+	return False, watermark
+
+def newer_than(entries, media_type, watermark):
+	key = attrgetter(SYNC_KEYS[media_type])
+	return (i for i in entries if key(i) > watermark)
+
+def raise_watermark(media_type, key):
+	if media_type in SYNC_KEYS and key > sync_watermarks.get(media_type, 0):
+		sync_watermarks[media_type] = key
+
+def hold_watermark(media_type, key):
+	#an entry whose fetch or write failed, the next incremental pass has to see it again
+	if key < watermark_holds.get(media_type, key + 1):
+		watermark_holds[media_type] = key
+
+def save_watermark(media_type, full):
+	#only called once a pass has completed and flush_writes has run, so the watermark never runs ahead of the PROCESSED rows
+	db_flush()
+	conn = Utils.db_con
+	now = int(time.time())
+	last_full = db_access.sync_state_get(conn, media_type)[1]
+	watermark = sync_watermarks.get(media_type, 0)
+	if media_type in watermark_holds:
+		watermark = min(watermark, watermark_holds.pop(media_type) - 1)
+		log_to_kodi(f"{media_type} watermark held at {watermark}, failed entries are retried on the next pass")
+	if full and CATALOG_URLS[media_type] not in catalog_failures:
+		last_full = now
+	elif full:
+		log_to_kodi(f"{media_type} catalog failed, the full pass is not recorded")
+	with conn:
+		db_access.sync_state_set(conn, media_type, watermark, last_full, now)
+
+CATALOG_DIFF = Utils.get_addon_setting('catalog_diff', 'bool', False)
+catalog_changes = {}
+#media_type -> {id: strm paths} of changed entries, read before their PROCESSED rows are dropped
+changed_paths = {}
+
+def diff_catalog(entries, media_type, full=False):
+	"""
+	Diff the catalog against the stored snapshot and return only the added and changed entries, or every entry on a full pass.
+	PROCESSED rows of removed and changed ids are dropped so the STRM creator rewrites changed entries.
+	A removed series takes the episode rows and files of its tmdb id with it.
+	"""
+	entries = list(entries)
+	if not entries:
+		#a failed or empty catalog would mark every entry removed, nothing is diffed and the snapshot is left as it is
+		log_to_kodi(f"{media_type} catalog is empty or could not be fetched, catalog diff skipped")
+		return entries
+	conn = Utils.db_con
+	start = time.time()
+	snapshot = catalog_diff.build_snapshot(entries)
+	old_snapshot = db_access.snapshot_load(conn, media_type)
+	added, removed, changed = catalog_diff.diff_snapshots(old_snapshot, snapshot)
+	log_to_kodi(f"{media_type} catalog diff: {len(added)} added, {len(removed)} removed, {len(changed)} changed in {time.time() - start:.2f}s")
+	if not cleanup_allowed(len(removed), len(old_snapshot), f"{media_type} catalog diff"):
+		#removed ids stay in PROCESSED and the snapshot, the next run sees them again
+		removed = set()
+	removed_episodes = False
+	if media_type == 'TV_SHOW' and removed:
+		removed_episodes = load_removed_series(conn, old_snapshot, snapshot, removed)
+		if removed_episodes and not cleanup_allowed(*removed_episodes, f"{media_type} catalog diff episodes"):
+			removed, removed_episodes = set(), False
+	catalog_changes[media_type] = (snapshot, added | changed, removed)
+	if removed or changed:
+		db_flush()
+		orphan_paths = []
+		if removed_episodes and CLEANUP_ORPHANS:
+			#episode rows carry the series tmdb id, the TV_SHOW row itself has no files
+			orphan_paths = [row[0] for row in conn.execute('SELECT strm_path' + db_access.REMOVED_SERIES_EPISODES)]
+		if CLEANUP_ORPHANS and media_type == 'MOVIE':
+			orphan_paths = db_access.processed_paths_for_ids(conn, media_type, removed)
+			#a changed tmdb id or title moves the movie to a new folder, remove_stale_paths cleans the old one after the pass
+			changed_paths[media_type] = {id: db_access.processed_paths_for_ids(conn, media_type, [id]) for id in changed}
+		if CLEANUP_ORPHANS and CLEANUP_DRY_RUN:
+			#removed rows are kept so a later real cleanup still knows their files
+			drop_ids = changed
+		else:
+			drop_ids = removed | changed
+		with conn:
+			db_access.processed_delete_ids(conn, media_type, drop_ids)
+			if removed_episodes and not (CLEANUP_ORPHANS and CLEANUP_DRY_RUN):
+				conn.execute('DELETE' + db_access.REMOVED_SERIES_EPISODES)
+		if orphan_paths:
+			remove_orphan_files(orphan_paths)
+		global processed_items, processed_shows
+		processed_items, processed_shows = None, None
+	if media_type == 'TV_SHOW':
+		with conn:
+			conn.execute('DROP TABLE IF EXISTS temp_removed')
+	if full:
+		return entries
+	return [i for i in entries if catalog_diff.entry_key(i) in added or catalog_diff.entry_key(i) in changed]
+
+def load_removed_series(conn, old_snapshot, snapshot, removed):
+	"""
+	Fill temp_removed with the tmdb ids of removed series and return (episode rows, TV rows in PROCESSED) for cleanup_allowed, or False when there is nothing to remove.
+	A tmdb id another series in the catalog still carries is left out, its episode rows are shared.
+	"""
+	kept = {value[2] for value in snapshot.values()}
+	tmdb_ids = {old_snapshot[id][2] for id in removed} - kept - {''}
+	if len(tmdb_ids) < len(removed):
+		log_to_kodi(f"TV_SHOW catalog diff: {len(removed) - len(tmdb_ids)} removed series have no tmdb id of their own, their episode rows can not be told apart and are kept")
+	if not tmdb_ids:
+		return False
+	conn.execute('DROP TABLE IF EXISTS temp_removed')
+	conn.execute(db_access.TEMP_REMOVED_CREATE)
+	conn.executemany(db_access.TEMP_REMOVED_INSERT, ((i,) for i in tmdb_ids))
+	count = conn.execute('SELECT COUNT(*)' + db_access.REMOVED_SERIES_EPISODES).fetchone()[0]
+	total = dict(conn.execute(db_access.PROCESSED_COUNT_FILES).fetchall()).get('TV', 0)
+	return count, total
+
+def save_snapshot(media_type):
+	if media_type not in catalog_changes:
+		return
+	snapshot, ids, removed = catalog_changes.pop(media_type)
+	if CLEANUP_ORPHANS and CLEANUP_DRY_RUN:
+		#removed ids stay in the snapshot as well as in PROCESSED, so a later real run still sees them as removed
+		removed = set()
+	conn = Utils.db_con
+	with conn:
+		db_access.snapshot_apply(conn, media_type, snapshot, ids, removed)
+
+def remove_stale_paths(media_type):
+	"""
+	Remove the old files of changed entries that were rewritten under a new path, runs after flush_writes.
+	Entries that were not rewritten this run keep their old files, they still point at the same stream.
+	"""
+	old_paths = changed_paths.pop(media_type, None)
+	if not old_paths:
+		return
+	conn = Utils.db_con
+	stale = []
+	for id, paths in old_paths.items():
+		new_paths = db_access.processed_paths_for_ids(conn, media_type, [id])
+		if new_paths:
+			stale.extend(i for i in paths if i not in new_paths)
+	if stale:
+		still_used = db_access.processed_paths(conn, media_type)
+		stale = [i for i in stale if i not in still_used]
+	if stale:
+		remove_orphan_files(stale)
+
+def catalog_total(catalog):
+	try: return len(catalog)
+	except TypeError: return '?'
+
 def update_LIVE():
 	VOD_json(LIVE_API_URL)
 
@@ -106,126 +368,232 @@ def contains_non_english(text):
 
 
 
-def db_create(conn):
-	cursor = conn.cursor()
-	cursor.execute('''
-	CREATE TABLE IF NOT EXISTS PROCESSED (
-		id INT,
-		media_type TEXT,
-		tmdb_id INT,
-		added INT,
-		container_ext TEXT,
-		title TEXT,
-		kodi_added INT,
-		strm_path TEXT,
-		updated INT,
-		UNIQUE(id, title, media_type)
-	)
-	''')
-	conn.commit()
-	return
+#in memory copy of PROCESSED used for skip decisions, loaded once by load_processed()
+processed_items = None
+processed_shows = None
 
-def db_check_exists(id = None, title = None, media_type = None):
+def load_processed():
+	global processed_items, processed_shows
 	conn = Utils.db_con
-	cursor = conn.cursor()
-	db_create(conn)
+	processed_items = set()
+	processed_shows = {}
+	media_types = {}
+	for id, title, media_type, updated in db_access.processed_all(conn):
+		media_type = media_types.setdefault(media_type, media_type)
+		if media_type == 'TV_SHOW':
+			processed_shows[str(id)] = updated
+		else:
+			processed_items.add((str(id), title, media_type))
+	log_to_kodi(f"Loaded {len(processed_items)} processed items and {len(processed_shows)} shows")
+
+def db_check_exists(id = None, title = None, media_type = None):
+	if processed_items is None:
+		load_processed()
 	if media_type == 'TV_SHOW':
-		result = cursor.execute('''
-		SELECT * FROM PROCESSED WHERE ID = %s and media_type = '%s'
-		''' % (id, media_type))
-		results = result.fetchall()
-		if results != []:
-			updated = results[0][8]
+		updated = processed_shows.get(str(id))
+		if updated is not None:
 			if int(title) >= int(updated):
 				return True
 			else:
 				return False
 	else:
-		result = cursor.execute('''
-		SELECT * FROM PROCESSED WHERE ID = %s and title = '%s' and media_type = '%s'
-		''' % (id, title, media_type))
-		return result.fetchall()
+		return (str(id), title, media_type) in processed_items or (str(id), db_access.legacy_title(title), media_type) in processed_items
 
-"""
-def db_update(data):
-	conn = Utils.db_con
-	cursor = conn.cursor()
-	#cursor.execute('DROP TABLE PROCESSED')
-	db_create(conn)
-	cursor.execute('''
-	INSERT OR IGNORE INTO PROCESSED (id, media_type, tmdb_id, added, container_ext, title, kodi_added, strm_path, updated)
-	VALUES (:id, :media_type, :tmdb_id, :added, :container_ext, :title, :kodi_added, :strm_path, :updated)
-	''', data)
-	conn.commit()
-"""
+DB_BATCH_ROWS = Utils.get_addon_setting('db_batch_rows', 'int', 200)
+DB_BATCH_SECONDS = Utils.get_addon_setting('db_batch_seconds', 'float', 5.0)
+pending_rows = []
+pending_since = time.monotonic()
 
 def db_update(data):
-	conn = Utils.db_con
-	cursor = conn.cursor()
-	db_create(conn)
-
-	cursor.execute('''
-	INSERT INTO PROCESSED (id, media_type, tmdb_id, added, container_ext, title, kodi_added, strm_path, updated)
-	VALUES (:id, :media_type, :tmdb_id, :added, :container_ext, :title, :kodi_added, :strm_path, :updated)
-	ON CONFLICT(id, title, media_type) DO UPDATE SET
-		media_type = excluded.media_type,
-		tmdb_id = excluded.tmdb_id,
-		added = excluded.added,
-		container_ext = excluded.container_ext,
-		title = excluded.title,
-		kodi_added = excluded.kodi_added,
-		strm_path = excluded.strm_path,
-		updated = excluded.updated
-	''', data)
-
-	conn.commit()
+	#rows are queued and written by db_flush, callers only queue a row once its files are on disk
+	global pending_since
+	if len(pending_rows) == 0:
+		pending_since = time.monotonic()
+	pending_rows.append(dict(data))
+	raise_watermark(data['media_type'], data['updated'])
+	if processed_items is not None:
+		if data['media_type'] == 'TV_SHOW':
+			processed_shows[str(data['id'])] = data['updated']
+		else:
+			processed_items.add((str(data['id']), data['title'], data['media_type']))
+	if len(pending_rows) >= DB_BATCH_ROWS or time.monotonic() - pending_since >= DB_BATCH_SECONDS:
+		db_flush()
 
-def db_remove_missing_on_json(id_added_list):
-	#valid_pairs = [(entry['stream_id'], entry['added']) for entry in valid_entries]
-	valid_pairs = id_added_list
+pending_hashes = []
 
-	# Connect to DB
+def db_flush():
+	#write every queued PROCESSED row and file hash in a single transaction
+	if len(pending_rows) == 0 and len(pending_hashes) == 0:
+		return
+	conn = Utils.db_con
+	with conn:
+		db_access.processed_upsert_many(conn, pending_rows)
+		db_access.file_hash_put_many(conn, pending_hashes)
+	pending_rows.clear()
+	pending_hashes.clear()
+
+atexit.register(db_flush)
+
+RECONCILE_CHUNK = 5000
+
+def db_remove_missing_on_json(valid_rows, chunk_size=RECONCILE_CHUNK, failed_series=()):
+	"""
+	Delete PROCESSED rows whose (id, added, media_type) is not in valid_rows.
+	valid_rows is any iterable of (stream_id, added, media_type) tuples, it is written to the temp table in chunks and never held in memory.
+	failed_series is filled while valid_rows is consumed with the tmdb ids ('' when unknown) of series whose info could not be fetched, their episode rows are kept.
+	Nothing is deleted when a catalog fetch failed or came back empty this run.
+	"""
+	db_flush()
 	conn = Utils.db_con
+	start = time.time()
 	cursor = conn.cursor()
-
-	# Create a temporary table to hold valid pairs
 	cursor.execute('DROP TABLE IF EXISTS temp_valid')
-	cursor.execute('''
-	CREATE TEMP TABLE temp_valid (
-		stream_id TEXT,
-		added TEXT,
-		media_type TEXT
-	)
-	''')
-
-	# Insert valid pairs into temp table
-	cursor.executemany('INSERT INTO temp_valid (stream_id, added, media_type) VALUES (:stream_id, :added, :media_type)', valid_pairs)
-
-	# Delete rows from PROCESSED that are not in temp_valid
-	cursor.execute('''
-	DELETE FROM PROCESSED
-	WHERE NOT EXISTS (
-		SELECT 1 FROM temp_valid
-		WHERE temp_valid.stream_id = PROCESSED.id
-		AND temp_valid.added = PROCESSED.added
-		AND temp_valid.media_type = PROCESSED.media_type
-	)
-	''')
-
-	# Commit and close
+	cursor.execute(db_access.TEMP_VALID_CREATE)
+	valid_rows = iter(valid_rows)
+	total = 0
+	while True:
+		chunk = list(islice(valid_rows, chunk_size))
+		if len(chunk) == 0:
+			break
+		cursor.executemany(db_access.TEMP_VALID_INSERT, chunk)
+		total += len(chunk)
+	if catalog_failures:
+		#a missing catalog would make every one of its rows look removed
+		cursor.execute('DROP TABLE temp_valid')
+		conn.commit()
+		log_to_kodi(f"Reconcile skipped, catalog failed or empty: {', '.join(sorted(catalog_name(i) for i in catalog_failures))}")
+		return 0
+	#the index is built once after the bulk insert instead of being maintained row by row
+	cursor.execute(db_access.TEMP_VALID_INDEX)
+	valid = db_access.TEMP_VALID_EXISTS
+	keep = ''
+	cursor.execute('DROP TABLE IF EXISTS temp_failed')
+	if failed_series:
+		if all(failed_series):
+			cursor.execute(db_access.TEMP_FAILED_CREATE)
+			cursor.executemany(db_access.TEMP_FAILED_INSERT, ((i,) for i in failed_series))
+			keep = db_access.KEEP_FAILED_SERIES
+		else:
+			#a failed series without a catalog tmdb id can not be told apart, every episode row is kept
+			keep = db_access.KEEP_ALL_EPISODES
+		log_to_kodi(f"Reconcile: get_series_info failed for {len(failed_series)} series, their episodes are kept")
+	#the limit is per media type, losing the movie catalog must not hide behind a large TV library
+	doomed = dict(cursor.execute("SELECT media_type, COUNT(*) FROM PROCESSED WHERE media_type IN ('TV', 'MOVIE') AND NOT" + valid + keep + ' GROUP BY media_type').fetchall())
+	totals = dict(cursor.execute(db_access.PROCESSED_COUNT_FILES).fetchall())
+	allowed = all([cleanup_allowed(count, totals.get(media_type, 0), f"Reconcile {media_type}") for media_type, count in doomed.items()])
+	orphan_paths = []
+	if CLEANUP_ORPHANS and allowed:
+		#pre-select the files of the rows about to be removed, TV_SHOW rows have no files of their own
+		#a path can still belong to a surviving row, e.g. an episode re-added under a new stream id
+		still_used = {row[0] for row in cursor.execute('SELECT strm_path FROM PROCESSED WHERE' + valid)}
+		orphan_paths = [row[0] for row in cursor.execute("SELECT strm_path FROM PROCESSED WHERE media_type IN ('TV', 'MOVIE') AND NOT" + valid + keep) if row[0] not in still_used]
+	removed = 0
+	if allowed and not (CLEANUP_ORPHANS and CLEANUP_DRY_RUN):
+		cursor.execute('DELETE FROM PROCESSED WHERE NOT' + valid + keep)
+		removed = cursor.rowcount
+	cursor.execute('DROP TABLE temp_valid')
+	cursor.execute('DROP TABLE IF EXISTS temp_failed')
+	#Utils.db_con is shared with the TMDB cache, it stays open
 	conn.commit()
-	conn.close()
+	global processed_items, processed_shows
+	processed_items, processed_shows = None, None
+	log_to_kodi(f"Reconcile: {total} valid rows, removed {removed} PROCESSED rows in {time.time() - start:.1f}s")
+	if orphan_paths:
+		remove_orphan_files(orphan_paths)
+	return removed
 
-	
+#folders this run has created or seen, mkdir_p only hits the filesystem for new ones
+known_dirs = set()
 
 # Taken from https://stackoverflow.com/a/600612/119527
 def mkdir_p(path):
+	if path in known_dirs:
+		return
 	try:
 		os.makedirs(path)
 	except OSError as exc: # Python >2.5
 		if exc.errno == errno.EEXIST and os.path.isdir(path):
 			pass
 		else: raise
+	known_dirs.add(path)
+
+CLEANUP_ORPHANS = Utils.get_addon_setting('cleanup_orphans', 'bool', True)
+CLEANUP_DRY_RUN = Utils.get_addon_setting('cleanup_dry_run', 'bool', False)
+CLEANUP_MAX_PERCENT = Utils.get_addon_setting('cleanup_max_percent', 'float', 20.0)
+CLEANUP_FORCE = Utils.get_addon_setting('cleanup_force', 'bool', False)
+
+def cleanup_allowed(count, total, label):
+	#a removal of more than CLEANUP_MAX_PERCENT of the rows is refused unless forced, a dry run only reports so it always goes ahead
+	if CLEANUP_FORCE or (CLEANUP_ORPHANS and CLEANUP_DRY_RUN) or total <= 0 or count * 100.0 <= CLEANUP_MAX_PERCENT * total:
+		return True
+	log_to_kodi(f"{label}: refusing to remove {count} of {total} entries (over {CLEANUP_MAX_PERCENT:g}%), run a cleanup dry run or enable force cleanup")
+	return False
+
+def library_roots():
+	return [os.path.abspath(str(i)) for i in (MOVIES_DIR, TVSHOWS_DIR) if i]
+
+def in_library(path, roots):
+	return any(path.startswith(root + os.sep) for root in roots)
+
+def remove_orphan_files(strm_paths, dry_run=None):
+	"""
+	Delete the .strm and matching .nfo of removed PROCESSED rows, then every library folder left without a .strm.
+	A folder only goes when all that remains in it is .nfo files, anything else is assumed to belong to the user.
+	With dry_run nothing is deleted and the summary reports what would have been.
+	"""
+	if dry_run is None:
+		dry_run = CLEANUP_DRY_RUN
+	roots = library_roots()
+	summary = {'files': 0, 'bytes': 0, 'folders': 0}
+	gone = set()
+	folders = set()
+
+	def remove_file(path):
+		try: size = os.path.getsize(path)
+		except OSError: return
+		if not dry_run:
+			try: os.remove(path)
+			except OSError as ex:
+				log_to_kodi(f"Cleanup failed for {path}: {ex}")
+				return
+		gone.add(path)
+		summary['files'] += 1
+		summary['bytes'] += size
+
+	for strm_path in strm_paths:
+		strm_path = os.path.abspath(str(strm_path))
+		if not in_library(strm_path, roots):
+			continue
+		remove_file(strm_path)
+		remove_file(os.path.splitext(strm_path)[0] + '.nfo')
+		folders.add(os.path.dirname(strm_path))
+
+	#deepest first so a season folder is gone before its show folder is checked
+	for folder in sorted(folders, key=len, reverse=True):
+		while in_library(folder, roots) and folder not in gone:
+			try: entries = [i for i in os.scandir(folder) if i.path not in gone]
+			except OSError: break
+			if any(i.is_dir() or not i.name.endswith('.nfo') for i in entries):
+				break
+			for i in entries:
+				remove_file(i.path)
+			if not dry_run:
+				try: os.rmdir(folder)
+				except OSError: break
+				known_dirs.discard(folder)
+			gone.add(folder)
+			summary['folders'] += 1
+			folder = os.path.dirname(folder)
+
+	if not dry_run and gone:
+		conn = Utils.db_con
+		with conn:
+			db_access.file_hash_delete_many(conn, gone)
+	if dry_run:
+		for path in sorted(gone):
+			log_to_kodi(f"Would remove: {path}")
+	log_to_kodi(f"Orphan cleanup{' (dry run)' if dry_run else ''}: {summary['files']} files, {summary['bytes']} bytes, {summary['folders']} folders")
+	return summary
 
 def safe_open_w(path):
 	''' Open "path" for writing, creating any parent directories as needed.
@@ -233,372 +601,259 @@ def safe_open_w(path):
 	mkdir_p(os.path.dirname(path))
 	return open(path, 'w', encoding="utf-8")
 
-
-def kodi_movie_nfo(meta):
-	meta = remove_non_ascii(meta)
-	root = Element('movie')
-	SubElement(root, 'title').text = meta.get('title', '')
-	SubElement(root, 'originaltitle').text = meta.get('original_title', meta.get('title', ''))
-
-	sorttitle = meta.get('title', '')
-	if meta.get('belongs_to_collection'):
-		sorttitle = meta['belongs_to_collection'].get('name', sorttitle)
-	SubElement(root, 'sorttitle').text = sorttitle
-
-	ratings = SubElement(root, 'ratings')
-	imdb_id = meta.get('external_ids', {}).get('imdb_id')
-	if imdb_id:
-		rating = SubElement(ratings, 'rating', name='imdb', max='10', default='true')
-		SubElement(rating, 'value').text = str(meta.get('vote_average', ''))
-		SubElement(rating, 'votes').text = str(meta.get('vote_count', ''))
-	rating_tmdb = SubElement(ratings, 'rating', name='themoviedb', max='10')
-	SubElement(rating_tmdb, 'value').text = str(meta.get('vote_average', ''))
-	SubElement(rating_tmdb, 'votes').text = str(meta.get('vote_count', ''))
-	rating_trakt = SubElement(ratings, 'rating', name='trakt', max='10')
-	SubElement(rating_trakt, 'value').text = ''
-	SubElement(rating_trakt, 'votes').text = ''
-
-	SubElement(root, 'userrating').text = str(meta.get('vote_average', ''))
-	SubElement(root, 'top250').text = '0'
-	SubElement(root, 'outline').text = ''
-	SubElement(root, 'plot').text = meta.get('overview', '')
-	SubElement(root, 'tagline').text = meta.get('tagline', '')
-	SubElement(root, 'runtime').text = str(meta.get('runtime', ''))
-
-	poster_path = meta.get('poster_path')
-	backdrop_path = meta.get('backdrop_path')
-	if poster_path:
-		SubElement(root, 'thumb', aspect='poster', preview=f"https://image.tmdb.org/t/p/original{poster_path}").text = f"https://image.tmdb.org/t/p/original{poster_path}"
-	if backdrop_path:
-		SubElement(root, 'thumb', aspect='landscape', preview=f"https://image.tmdb.org/t/p/original{backdrop_path}").text = f"https://image.tmdb.org/t/p/original{backdrop_path}"
-		fanart = SubElement(root, 'fanart')
-		SubElement(fanart, 'thumb', preview=f"https://image.tmdb.org/t/p/w780{backdrop_path}").text = f"https://image.tmdb.org/t/p/original{backdrop_path}"
-
-	mpaa = ''
-	for rel in meta.get('release_dates', {}).get('results', []):
-		if rel.get('iso_3166_1') == 'US':
-			for r in rel.get('release_dates', []):
-				if r.get('certification'):
-					mpaa = r.get('certification')
-					break
-	SubElement(root, 'mpaa').text = mpaa
-	SubElement(root, 'playcount').text = '0'
-	SubElement(root, 'lastplayed').text = ''
-	SubElement(root, 'id').text = str(meta.get('id', ''))
-	if imdb_id:
-		SubElement(root, 'uniqueid', type='imdb').text = imdb_id
-	SubElement(root, 'uniqueid', type='tmdb', default='true').text = str(meta.get('id', ''))
-
-	for g in meta.get('genres', []):
-		SubElement(root, 'genre').text = g.get('name', '')
-	for c in meta.get('production_countries', []):
-		SubElement(root, 'country').text = c.get('name', '')
-
-	if meta.get('belongs_to_collection'):
-		set_el = SubElement(root, 'set')
-		SubElement(set_el, 'name').text = meta['belongs_to_collection'].get('name', '')
-		SubElement(set_el, 'overview').text = ''
-
-	for w in meta.get('credits', {}).get('crew', []):
-		if w.get('job', '').lower() == 'writer':
-			SubElement(root, 'credits').text = w.get('name', '')
-	for d in meta.get('credits', {}).get('crew', []):
-		if d.get('job', '').lower() == 'director':
-			SubElement(root, 'director').text = d.get('name', '')
-
-	SubElement(root, 'premiered').text = meta.get('release_date', '')
-	SubElement(root, 'year').text = (meta.get('release_date') or '')[:4]
-	SubElement(root, 'status').text = ''
-	SubElement(root, 'code').text = ''
-	SubElement(root, 'aired').text = ''
-
-	for s in meta.get('production_companies', []):
-		SubElement(root, 'studio').text = s.get('name', '')
-	SubElement(root, 'trailer').text = ''
-
-	for idx, actor in enumerate(meta.get('credits', {}).get('cast', [])):
-		actor_el = SubElement(root, 'actor')
-		SubElement(actor_el, 'name').text = actor.get('name', '')
-		SubElement(actor_el, 'role').text = actor.get('character', '')
-		SubElement(actor_el, 'order').text = str(idx)
-		if actor.get('profile_path'):
-			SubElement(actor_el, 'thumb').text = f"https://image.tmdb.org/t/p/original{actor['profile_path']}"
-
-	resume = SubElement(root, 'resume')
-	SubElement(resume, 'position').text = '0.000000'
-	SubElement(resume, 'total').text = '0.000000'
-	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
-
-def kodi_tvshow_nfo(meta):
-	meta = remove_non_ascii(meta)
-	root = Element('tvshow')
-	SubElement(root, 'title').text = meta.get('name', '')
-	SubElement(root, 'originaltitle').text = meta.get('original_name', meta.get('name', ''))
-	SubElement(root, 'showtitle').text = meta.get('name', '')
-
-	ratings = SubElement(root, 'ratings')
-	imdb_id = meta.get('external_ids', {}).get('imdb_id')
-	tvdb_id = meta.get('external_ids', {}).get('tvdb_id')
-	tmdb_id = meta.get('id')
-
-	rating_imdb = SubElement(ratings, 'rating', name='imdb', max='10', default='true')
-	SubElement(rating_imdb, 'value').text = ''
-	SubElement(rating_imdb, 'votes').text = ''
-	rating_tmdb = SubElement(ratings, 'rating', name='tmdb', max='10')
-	SubElement(rating_tmdb, 'value').text = str(meta.get('vote_average', ''))
-	SubElement(rating_tmdb, 'votes').text = str(meta.get('vote_count', ''))
-	rating_trakt = SubElement(ratings, 'rating', name='trakt', max='10')
-	SubElement(rating_trakt, 'value').text = ''
-	SubElement(rating_trakt, 'votes').text = ''
-
-	SubElement(root, 'userrating').text = str(meta.get('vote_average', ''))
-	SubElement(root, 'top250').text = '0'
-	SubElement(root, 'season').text = str(meta.get('number_of_seasons', ''))
-	SubElement(root, 'episode').text = str(meta.get('number_of_episodes', ''))
-	SubElement(root, 'displayseason').text = '-1'
-	SubElement(root, 'displayepisode').text = '-1'
-	SubElement(root, 'outline').text = ''
-	SubElement(root, 'plot').text = meta.get('overview', '')
-	SubElement(root, 'tagline').text = meta.get('tagline', '')
-	runtime = meta.get('episode_run_time', ['0'])[0] if meta.get('episode_run_time') else '0'
-	SubElement(root, 'runtime').text = str(runtime)
-
-	poster_path = meta.get('poster_path')
-	backdrop_path = meta.get('backdrop_path')
-	logo_path = ''
-	if meta.get('images'):
-		logos = meta['images'].get('logos', [])
-		if logos:
-			logo_path = logos[0].get('file_path', '')
-
-	if backdrop_path:
-		SubElement(root, 'thumb', aspect='landscape', preview=f"https://image.tmdb.org/t/p/w780{backdrop_path}").text = f"https://image.tmdb.org/t/p/original{backdrop_path}"
-	if logo_path:
-		SubElement(root, 'thumb', aspect='logos', preview=f"https://image.tmdb.org/t/p/w780{logo_path}").text = f"https://image.tmdb.org/t/p/original{logo_path}"
-	if poster_path:
-		SubElement(root, 'thumb', aspect='poster', preview=f"https://image.tmdb.org/t/p/w780{poster_path}").text = f"https://image.tmdb.org/t/p/original{poster_path}"
-
-	for season_data in meta.get('seasons', []):
-		s_poster = season_data.get('poster_path')
-		s_num = season_data.get('season_number')
-		if s_poster and s_num is not None:
-			SubElement(root, 'thumb', season=str(s_num), type='season', aspect='poster', preview=f"https://image.tmdb.org/t/p/w780{s_poster}").text = f"https://image.tmdb.org/t/p/original{s_poster}"
-
-	fanart = SubElement(root, 'fanart')
-	fanart_paths = []
-	if meta.get('images'):
-		fanart_paths = [img['file_path'] for img in meta['images'].get('backdrops', [])[:2] if img.get('file_path')]
-	elif backdrop_path:
-		fanart_paths = [backdrop_path]
-	for fpath in fanart_paths:
-		SubElement(fanart, 'thumb', preview=f"https://image.tmdb.org/t/p/original{fpath}").text = f"https://image.tmdb.org/t/p/original{fpath}"
-
-	mpaa = ''
-	for rel in meta.get('content_ratings', {}).get('results', []):
-		if rel.get('iso_3166_1') == 'US' and rel.get('rating'):
-			mpaa = f"US:{rel['rating']}"
-			break
-		elif rel.get('iso_3166_1') and rel.get('rating'):
-			mpaa = f"{rel['iso_3166_1']}:{rel['rating']}"
-	SubElement(root, 'mpaa').text = mpaa
-	SubElement(root, 'playcount').text = '0'
-	SubElement(root, 'lastplayed').text = ''
-	SubElement(root, 'id').text = str(tmdb_id or '')
-
-	if imdb_id:
-		SubElement(root, 'uniqueid', type='imdb').text = imdb_id
-	if tmdb_id:
-		SubElement(root, 'uniqueid', type='tmdb', default='true').text = str(tmdb_id)
-	if tvdb_id:
-		SubElement(root, 'uniqueid', type='tvdb').text = str(tvdb_id)
-
-	for g in meta.get('genres', []):
-		SubElement(root, 'genre').text = g.get('name', '')
-
-	premiered = meta.get('first_air_date', '')
-	SubElement(root, 'premiered').text = premiered
-	SubElement(root, 'year').text = premiered[:4] if premiered else ''
-	SubElement(root, 'status').text = meta.get('status', '')
-	SubElement(root, 'code').text = ''
-	SubElement(root, 'aired').text = ''
-
-	for s in meta.get('networks', []):
-		SubElement(root, 'studio').text = s.get('name', '')
-	SubElement(root, 'trailer').text = ''
-
-	for idx, actor in enumerate(meta.get('credits', {}).get('cast', [])):
-		actor_el = SubElement(root, 'actor')
-		SubElement(actor_el, 'name').text = actor.get('name', '')
-		SubElement(actor_el, 'role').text = actor.get('character', '')
-		SubElement(actor_el, 'order').text = str(idx)
-		if actor.get('profile_path'):
-			SubElement(actor_el, 'thumb').text = f"https://image.tmdb.org/t/p/original{actor['profile_path']}"
-
-	for season_data in meta.get('seasons', []):
-		if season_data.get('season_number') is not None and season_data.get('name'):
-			namedseason = SubElement(root, 'namedseason')
-			namedseason.set('number', str(season_data['season_number']))
-			namedseason.text = season_data['name']
-
-	resume = SubElement(root, 'resume')
-	SubElement(resume, 'position').text = '0.000000'
-	SubElement(resume, 'total').text = '0.000000'
-	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
-
-
-def kodi_season_nfo(season, tvshow):
-	from xml.etree.ElementTree import Element, SubElement, tostring
-	from datetime import datetime
-
-	def remove_non_ascii(data):
-		if isinstance(data, dict):
-			return {k: remove_non_ascii(v) for k, v in data.items()}
-		elif isinstance(data, list):
-			return [remove_non_ascii(item) for item in data]
-		elif isinstance(data, str):
-			return ''.join(c for c in data if ord(c) < 128)
-		return data
-
-	season = remove_non_ascii(season)
-	tvshow = remove_non_ascii(tvshow)
-
-	root = Element('season')
-	SubElement(root, 'title').text = f"{tvshow.get('name', '')} - {season.get('name', '')}"
-	SubElement(root, 'plot').text = season.get('overview', '')
-	SubElement(root, 'season').text = str(season.get('season_number', ''))
-	SubElement(root, 'year').text = (season.get('air_date') or '')[:4]
-	SubElement(root, 'id').text = str(season.get('id', ''))
-	SubElement(root, 'tvshowid').text = str(tvshow.get('id', ''))
-
-	# Poster thumbnail
-	poster_path = season.get('poster_path')
-	if poster_path:
-		SubElement(root, 'thumb', aspect='poster', preview=f"https://image.tmdb.org/t/p/w780{poster_path}").text = f"https://image.tmdb.org/t/p/original{poster_path}"
-
-	# Fanart from TV show
-	fanart = SubElement(root, 'fanart')
-	backdrops = tvshow.get('images', {}).get('backdrops', [])
-	for backdrop in backdrops[:2]:
-		path = backdrop.get('file_path')
-		if path:
-			SubElement(fanart, 'thumb', preview=f"https://image.tmdb.org/t/p/original{path}").text = f"https://image.tmdb.org/t/p/original{path}"
-
-	# Ratings
-	ratings = SubElement(root, 'ratings')
-	rating_tmdb = SubElement(ratings, 'rating', name='tmdb', max='10', default='true')
-	SubElement(rating_tmdb, 'value').text = str(tvshow.get('vote_average', ''))
-	SubElement(rating_tmdb, 'votes').text = str(tvshow.get('vote_count', ''))
-
-	# Genres
-	for genre in tvshow.get('genres', []):
-		SubElement(root, 'genre').text = genre.get('name', '')
-
-	# Studios (networks)
-	for network in tvshow.get('networks', []):
-		SubElement(root, 'studio').text = network.get('name', '')
-
-	# Named season
-	if season.get('season_number') is not None and season.get('name'):
-		namedseason = SubElement(root, 'namedseason')
-		namedseason.set('number', str(season.get('season_number')))
-		namedseason.text = season.get('name')
-
-	# Resume block
-	resume = SubElement(root, 'resume')
-	SubElement(resume, 'position').text = '0.000000'
-	SubElement(resume, 'total').text = '0.000000'
-
-	# Date added
-	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
-
-
-def kodi_episode_nfo(episode, tvshow):
-	episode = remove_non_ascii(episode)
-	tvshow = remove_non_ascii(tvshow)
-
-	root = Element('episodedetails')
-	SubElement(root, 'title').text = episode.get('name', '')
-	SubElement(root, 'showtitle').text = tvshow.get('name', '')
-	SubElement(root, 'season').text = str(episode.get('season_number', ''))
-	SubElement(root, 'episode').text = str(episode.get('episode_number', ''))
-	SubElement(root, 'displayseason').text = '-1'
-	SubElement(root, 'displayepisode').text = '-1'
-	SubElement(root, 'aired').text = episode.get('air_date', '')
-	SubElement(root, 'plot').text = episode.get('overview', '')
-	SubElement(root, 'tagline').text = ''
-	SubElement(root, 'runtime').text = str(episode.get('runtime', ''))
-	SubElement(root, 'mpaa').text = ''
-	SubElement(root, 'playcount').text = '0'
-	SubElement(root, 'lastplayed').text = ''
-	SubElement(root, 'id').text = str(episode.get('id', ''))
-
-	imdb_id = episode.get('external_ids', {}).get('imdb_id')
-	tmdb_id = episode.get('id')
-	tvdb_id = episode.get('external_ids', {}).get('tvdb_id')
-	if imdb_id:
-		SubElement(root, 'uniqueid', type='imdb').text = imdb_id
-	if tmdb_id:
-		SubElement(root, 'uniqueid', type='tmdb', default='true').text = str(tmdb_id)
-	if tvdb_id:
-		SubElement(root, 'uniqueid', type='tvdb').text = str(tvdb_id)
-
-	ratings = SubElement(root, 'ratings')
-	rating_imdb = SubElement(ratings, 'rating', name='imdb', max='10', default='true')
-	SubElement(rating_imdb, 'value').text = str(episode.get('vote_average', ''))
-	SubElement(rating_imdb, 'votes').text = str(episode.get('vote_count', ''))
-	rating_tmdb = SubElement(ratings, 'rating', name='tmdb', max='10')
-	SubElement(rating_tmdb, 'value').text = str(episode.get('vote_average', ''))
-	SubElement(rating_tmdb, 'votes').text = str(episode.get('vote_count', ''))
-	rating_trakt = SubElement(ratings, 'rating', name='trakt', max='10')
-	SubElement(rating_trakt, 'value').text = ''
-	SubElement(rating_trakt, 'votes').text = ''
-	SubElement(root, 'userrating').text = '0'
-	SubElement(root, 'top250').text = '0'
-
-	for g in tvshow.get('genres', []):
-		SubElement(root, 'genre').text = g.get('name', '')
-
-	for w in episode.get('crew', []):
-		if w.get('job', '').lower() == 'writer':
-			SubElement(root, 'credits').text = w.get('name', '')
-	for d in episode.get('crew', []):
-		if d.get('job', '').lower() == 'director':
-			SubElement(root, 'director').text = d.get('name', '')
-
-	for s in tvshow.get('networks', []):
-		SubElement(root, 'studio').text = s.get('name', '')
-	SubElement(root, 'trailer').text = ''
-
-	thumbs = []
-	if episode.get('still_path'):
-		thumbs.append(episode['still_path'])
-	if episode.get('images'):
-		thumbs += [img['file_path'] for img in episode['images'].get('stills', []) if img.get('file_path')]
-	for t in thumbs[:2]:
-		SubElement(root, 'thumb', aspect='thumb', preview=f"https://image.tmdb.org/t/p/w780{t}").text = f"https://image.tmdb.org/t/p/original{t}"
-
-	resume = SubElement(root, 'resume')
-	SubElement(resume, 'position').text = '0.000000'
-	SubElement(resume, 'total').text = '0.000000'
-	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-	cast = episode.get('guest_stars', []) or episode.get('credits', {}).get('cast', [])
-	for idx, actor in enumerate(cast):
-		actor_el = SubElement(root, 'actor')
-		SubElement(actor_el, 'name').text = actor.get('name', '')
-		SubElement(actor_el, 'role').text = actor.get('character', '')
-		SubElement(actor_el, 'order').text = str(idx)
-		if actor.get('profile_path'):
-			SubElement(actor_el, 'thumb').text = f"https://image.tmdb.org/t/p/original{actor['profile_path']}"
-
-	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
-
+def write_files(files):
+	for path, content in files:
+		with safe_open_w(path) as f:
+			f.write(content)
+
+WRITER_WORKERS = Utils.get_addon_setting('writer_workers', 'int', 4)
+WRITER_QUEUE = Utils.get_addon_setting('writer_queue', 'int', 64)
+SKIP_UNCHANGED = Utils.get_addon_setting('skip_unchanged', 'bool', True)
+DATEADDED = re.compile(r'<dateadded>[^<]*</dateadded>')
+
+def content_hash(content):
+	#dateadded is the render time, it is left out so an unchanged NFO hashes the same on every run
+	return hashlib.md5(DATEADDED.sub('', content).encode('utf-8')).hexdigest()
+
+class FileWriter:
+	"""
+	Writes STRM/NFO files on a pool of writer threads while the main thread keeps resolving metadata.
+	Jobs for the same folder always go to the same single threaded lane, so writes to one path keep their order.
+	submit blocks once queue_size jobs are in flight, rows are only passed to db_update by drain once every file of the job is written.
+	"""
+	def __init__(self, workers=WRITER_WORKERS, queue_size=WRITER_QUEUE, skip_unchanged=SKIP_UNCHANGED):
+		self.lanes = [ThreadPoolExecutor(max_workers=1) for _ in range(max(1, workers))]
+		self.slots = threading.BoundedSemaphore(max(1, queue_size))
+		self.pending = deque()
+		self.skip_unchanged = skip_unchanged
+		#path -> hash of everything submitted this run, show and season files are only written once per run
+		self.run_hashes = {}
+		self.written = 0
+		self.skipped = 0
+
+	def changed_files(self, files):
+		#returns the files whose content differs from what was last written, with their hashes
+		changed = []
+		for path, content in files:
+			digest = content_hash(content)
+			if self.skip_unchanged:
+				if self.run_hashes.get(path) == digest:
+					self.skipped += 1
+					continue
+				if path not in self.run_hashes and db_access.file_hash_get(Utils.db_con, path) == digest and os.path.isfile(path):
+					self.run_hashes[path] = digest
+					self.skipped += 1
+					continue
+			self.run_hashes[path] = digest
+			changed.append((path, content, digest))
+		return changed
+
+	def submit(self, files, lane_key='', row=None, message=None, after=()):
+		futures = list(after)
+		hashes = []
+		if files:
+			files = self.changed_files(files)
+			hashes = [(path, digest) for path, content, digest in files]
+		if files:
+			self.slots.acquire()
+			future = self.lanes[hash(lane_key) % len(self.lanes)].submit(write_files, [(path, content) for path, content, digest in files])
+			future.add_done_callback(lambda _: self.slots.release())
+			futures.append(future)
+		self.pending.append((futures, row, message, hashes))
+		self.drain()
+		return futures
+
+	def drain(self, wait=False):
+		#runs on the main thread, rows are recorded in submission order
+		while self.pending:
+			futures, row, message, hashes = self.pending[0]
+			if not wait and not all(i.done() for i in futures):
+				return
+			self.pending.popleft()
+			try:
+				for i in futures:
+					i.result()
+			except Exception as ex:
+				log_to_kodi(f"Write failed, not recorded: {message or row}: {ex}")
+				if row:
+					hold_watermark(row['media_type'], row['updated'])
+				for path, digest in hashes:
+					self.run_hashes.pop(path, None)
+				continue
+			self.written += len(hashes)
+			pending_hashes.extend(hashes)
+			if row:
+				db_update(row)
+			if message:
+				log_to_kodi(message)
+
+	def close(self):
+		self.drain(wait=True)
+		for i in self.lanes:
+			i.shutdown()
+		log_to_kodi(f"Files: {self.written} written, {self.skipped} unchanged and skipped")
+
+file_writer = FileWriter()
+
+
+def nfo_profile(setting_name):
+	name = Utils.get_addon_setting(setting_name, 'string', 'full')
+	if name not in nfo.PROFILES:
+		log_to_kodi(f"Unknown NFO profile {name} for {setting_name}, using full")
+		name = 'full'
+	return nfo.PROFILES[name]
+
+MOVIE_NFO_PROFILE = nfo_profile('nfo_profile_movies')
+TV_NFO_PROFILE = nfo_profile('nfo_profile_tv')
+
+NFO_PROCESSES = Utils.get_addon_setting('nfo_processes', 'int', 0)
+NFO_CHUNK = Utils.get_addon_setting('nfo_chunk', 'int', 32)
+#file content still to be rendered, kind is a key of nfo.RENDERERS
+Render = namedtuple('Render', 'kind args')
+
+class NfoStage:
+	"""
+	Optional process pool in front of the FileWriter, Render contents are batched into chunks of one kind and rendered by nfo.render_chunk in worker processes.
+	The workers only run nfo.py and send the XML strings back, jobs are then handed to the FileWriter on the main thread in submission order.
+	Until start is called with processes, and always inside Kodi, Render contents are rendered in process.
+	"""
+	def __init__(self, writer, chunk_size=NFO_CHUNK):
+		self.writer = writer
+		self.chunk_size = max(1, chunk_size)
+		self.max_jobs = self.chunk_size * 2
+		#(slot, kind, args) not yet sent to the pool, a slot is [file index, chunk future, position in the chunk]
+		self.batch = []
+		#(files, slots, kwargs, futures_out) in submission order
+		self.jobs = deque()
+		self.pool = None
+
+	def start(self, processes=NFO_PROCESSES):
+		#called from main before any writer or fetch thread exists, so forked workers never inherit a running thread
+		if processes <= 0:
+			return
+		if xbmc_flag:
+			#sys.executable is the Kodi binary there, a spawned worker can not be started and forking Kodi is not safe
+			log_to_kodi('NFO processes are only used by standalone runs, rendering in process inside Kodi')
+			return
+		self.pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context())
+		self.max_jobs = self.chunk_size * processes * 2
+		#start the workers now, a spawned worker imports addon.py as __mp_main__ which stops short of main()
+		self.pool.submit(int).result()
+
+	def submit(self, files, futures_out=None, **kwargs):
+		#kwargs are passed on to FileWriter.submit, the writer futures of the job are added to futures_out
+		if self.pool is None:
+			if files:
+				files = [(path, nfo.RENDERERS[content.kind](*content.args) if isinstance(content, Render) else content) for path, content in files]
+			futures = self.writer.submit(files, **kwargs)
+			if futures_out is not None:
+				futures_out.extend(futures)
+			return
+		files = list(files or ())
+		slots = []
+		for index, (path, content) in enumerate(files):
+			if isinstance(content, Render):
+				slot = [index, None, 0]
+				slots.append(slot)
+				self.batch.append((slot, content.kind, content.args))
+		self.jobs.append((files, slots, kwargs, futures_out))
+		if len(self.batch) >= self.chunk_size:
+			self.flush()
+		self.dispatch(keep=self.max_jobs)
+
+	def flush(self):
+		kinds = {}
+		for slot, kind, args in self.batch:
+			kinds.setdefault(kind, []).append((slot, args))
+		self.batch = []
+		for kind, items in kinds.items():
+			#one pickle per chunk, a tvshow payload shared by the episodes of a chunk is only sent once
+			future = self.pool.submit(nfo.render_chunk, kind, [args for slot, args in items])
+			for position, (slot, args) in enumerate(items):
+				slot[1], slot[2] = future, position
+
+	def dispatch(self, keep=None):
+		#hands rendered jobs to the writer in order, blocks on the oldest job while more than keep jobs are queued
+		while self.jobs:
+			files, slots, kwargs, futures_out = self.jobs[0]
+			block = keep is not None and len(self.jobs) > keep
+			if any(slot[1] is None for slot in slots):
+				if not block:
+					return
+				self.flush()
+			if not block and not all(slot[1].done() for slot in slots):
+				return
+			self.jobs.popleft()
+			try:
+				for index, future, position in slots:
+					files[index] = (files[index][0], future.result()[position])
+			except Exception as ex:
+				log_to_kodi(f"NFO render failed, not recorded: {kwargs.get('message') or kwargs.get('row')}: {ex}")
+				if kwargs.get('row'):
+					hold_watermark(kwargs['row']['media_type'], kwargs['row']['updated'])
+				if futures_out is not None:
+					#keeps a show row waiting on this job from being recorded
+					failed = Future()
+					failed.set_exception(ex)
+					futures_out.append(failed)
+				continue
+			futures = self.writer.submit(files, **kwargs)
+			if futures_out is not None:
+				futures_out.extend(futures)
+
+	def drain(self):
+		#every queued job is rendered and handed to the writer
+		if self.pool is None:
+			return
+		self.flush()
+		self.dispatch(keep=0)
+
+	def close(self):
+		if self.pool is None:
+			return
+		self.drain()
+		self.pool.shutdown()
+		self.pool = None
+
+nfo_stage = NfoStage(file_writer)
+
+def flush_writes():
+	#files handed to the stage and the writer are on disk and their rows written, a watermark or snapshot saved after this never runs ahead of them
+	nfo_stage.drain()
+	file_writer.drain(wait=True)
+	db_flush()
+
+
+RENDER_CACHE_SIZE = 256
+#show and season NFOs rendered this run, keyed by (kind, tmdb_id, season, payload hashes)
+render_cache = OrderedDict()
+render_stats = {'rendered': 0, 'saved': 0}
+payload_hashes = OrderedDict()
+
+def payload_hash(payload):
+	#the memoized TMDB lookups hand back the same dict for every episode of a show, so each object is hashed once
+	entry = payload_hashes.get(id(payload))
+	if entry is not None and entry[0] is payload:
+		return entry[1]
+	digest = hashlib.md5(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+	payload_hashes[id(payload)] = (payload, digest)
+	while len(payload_hashes) > 8:
+		payload_hashes.popitem(last=False)
+	return digest
+
+def cached_render(kind, tmdb_id, season, payloads, render):
+	key = (kind, str(tmdb_id), str(season)) + tuple(payload_hash(i) for i in payloads)
+	xml = render_cache.get(key)
+	if xml is not None:
+		render_cache.move_to_end(key)
+		render_stats['saved'] += 1
+		return xml
+	xml = render(*payloads)
+	render_cache[key] = xml
+	while len(render_cache) > RENDER_CACHE_SIZE:
+		render_cache.popitem(last=False)
+	render_stats['rendered'] += 1
+	return xml
 
 def startup_update():
 	update_LIVE()
@@ -606,15 +861,89 @@ def startup_update():
 	vod_TV = VOD_json(SERIES_API_URL)
 
 def get_series_id(series_id_item):
-	series_id = series_id_item['series_id']
+	series_id = series_id_item.series_id
 	return series_id
 
+def iter_series_episodes(vod_series):
+	#yields (season_item, episode) for the different get_series_info layouts providers return
+	#episodes is either a dict keyed by season number or a list of per season episode lists
+	seasons = 'episodes'
+	episodes_type = 'string'
+	for ib in vod_series['seasons']:
+		if 'season_number' in str(ib):
+			seasons = 'seasons'
+	if seasons == 'episodes':
+		for ic in vod_series['episodes']:
+			if type(ic) == type(''):
+				episodes_type = 'string'
+			elif type(ic) == type([]):
+				episodes_type = 'list'
+	if type(vod_series.get('episodes',{})) == type([]):
+		if type(vod_series.get('episodes',{})[0]) == type([]):
+			seasons = 'episodes'
+			episodes_type = 'list'
+
+	if episodes_type == 'string':
+		for j in vod_series[seasons]:
+			if type(j) == type({}):
+				curr_season = str(j['season_number'])
+			else:
+				curr_season = str(j)
+			if vod_series.get('episodes',{}).get(curr_season,'') == '':
+				continue
+			for jx in vod_series['episodes'][curr_season]:
+				yield j, jx
+	else:
+		for j in vod_series[seasons]:
+			for jx in j:
+				if type(j) == type([]):
+					yield j[0], jx
+				else:
+					yield j, jx
+
+def season_number(season_item):
+	if type(season_item) == type(''):
+		return int(season_item)
+	if season_item.get('season_number','') == '':
+		return season_item['season']
+	return season_item['season_number']
+
+def prefetch_movie_info(vod_json, batch_size=200):
+	#resolve tmdb movie info for the next batch of unprocessed movies in parallel before they are written
+	vod_json = iter(vod_json)
+	while True:
+		batch = list(islice(vod_json, batch_size))
+		if len(batch) == 0:
+			return
+		Utils.resolve_tmdb_batch([('movie', i.tmdb, None, None) for i in batch if i.stream_type == 'movie' and i.tmdb != '' and not db_check_exists(id = i.stream_id, title = i.name, media_type='MOVIE')])
+		for i in batch:
+			yield i
+
+def prefetch_series_info(vod_TV, workers=None):
+	#fetch get_series_info on a thread pool ahead of the strm/nfo writer, results are yielded in catalog order
+	workers = max(1, workers or SERIES_WORKERS)
+	pending = deque()
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		for i in vod_TV:
+			pending.append((i, pool.submit(VOD_json, get_series_info, series_id=get_series_id(i))))
+			if len(pending) >= workers * 2:
+				yield series_info_result(*pending.popleft())
+		while pending:
+			yield series_info_result(*pending.popleft())
+
+def series_info_result(i, future):
+	try:
+		return i, future.result()
+	except Exception as ex:
+		log_to_kodi(f"get_series_info failed for {i.name}: {ex}")
+		return i, None
+
 def check_db_missing_on_json():
 	#remove entries from the DB which are no longer present in the VOD json data
 	id_added_list = []
-	vod_TV = VOD_json(SERIES_API_URL)
+	vod_TV = list(catalog_records(SERIES_API_URL, records.SeriesEntry))
 	for ix, i in enumerate(vod_TV):
-		print(i['name'], ix,' of total shows ' , len(vod_TV))
+		print(i.name, ix,' of total shows ' , len(vod_TV))
 		series_id=get_series_id(i)
 		vod_series = VOD_json(get_series_info, series_id=series_id)
 		if len(vod_series['seasons']) == 0:
@@ -632,7 +961,7 @@ def check_db_missing_on_json():
 				curr_season = str(j['season_number'])
 			elif type(j) == type([]):
 				for jx in j:
-					curr_item = {"stream_id": jx['id'], "added": jx['added'], 'media_type': 'TV'}
+					curr_item = (jx['id'], jx['added'], 'TV')
 					id_added_list.append(curr_item)
 					#print(2,curr_item )
 					continue
@@ -642,133 +971,51 @@ def check_db_missing_on_json():
 			if curr_season not in vod_series['episodes']:
 				continue
 			for jx in vod_series['episodes'][curr_season]:
-				curr_item = {"stream_id": jx['id'], "added": jx['added'], 'media_type': 'TV'}
+				curr_item = (jx['id'], jx['added'], 'TV')
 				#print(1,curr_item )
 
 
-	vod_json = VOD_json(VOD_API_URL)
-	for i in vod_json:
-		curr_item = {"stream_id": i['stream_id'], "added": i['added'], 'media_type': 'MOVIE'}
+	for i in catalog_records(VOD_API_URL, records.VodEntry):
+		curr_item = (i.stream_id, i.added, 'MOVIE')
 		id_added_list.append(curr_item)
 		#print(1,curr_item )
 
 	db_remove_missing_on_json(id_added_list)
 
 
-def check_db_missing_on_json2():
-	#remove entries from the DB which are no longer present in the VOD json data
-	id_added_list = []
-	vod_TV = VOD_json(SERIES_API_URL)
-	for ix, i in enumerate(vod_TV):
-		#print(i['name'], ix,' of total shows ' , len(vod_TV))
-		series_id = get_series_id(i)
-		vod_series = VOD_json(get_series_info, series_id=series_id)
-		#log_to_kodi(i['name'])
-		if not vod_series or 'seasons' not in vod_series or 'episodes' not in vod_series:
+def iter_valid_rows(failed_series=None):
+	#(stream_id, added, media_type) for every episode and movie the provider still lists
+	#series info comes through prefetch_series_info, so cached responses are reused and misses are fetched concurrently
+	#a series whose info fails or comes back without episodes is added to failed_series, its episodes are not known to be gone
+	for i, vod_series in prefetch_series_info(catalog_records(SERIES_API_URL, records.SeriesEntry)):
+		if not isinstance(vod_series, dict) or 'seasons' not in vod_series or 'episodes' not in vod_series:
+			if failed_series is not None:
+				failed_series.append(str(i.tmdb))
 			continue
+		for j, jx in iter_series_episodes(vod_series):
+			if season_number(j) == 0 or records.to_int(jx.get('episode_num')) == 0:
+				continue
+			yield (jx.get('id'), jx.get('added'), 'TV')
+	for i in catalog_records(VOD_API_URL, records.VodEntry):
+		yield (i.stream_id, i.added, 'MOVIE')
 
-		seasons = 'episodes'
-		episodes_type = 'string'
-		for ib in vod_series['seasons']:
-			if 'season_number' in str(ib):
-				seasons = 'seasons'
-		if seasons == 'episodes':
-			for ic in vod_series['episodes']:
-				if type(ic) == type(''):
-					episodes_type = 'string'
-				elif type(ic) == type([]):
-					episodes_type = 'list'
-
-		def do_episode(id_added_list, ep_item, tv_item, season_item):
-			jx = ep_item
-			i = tv_item
-			j = season_item
-			if type(season_item) == type(''):
-				j = {'season_number': int(season_item)}
-			if j.get('season_number','') == '':
-				j['season_number'] = j['season']
-			if j['season_number'] == 0 or jx['episode_num'] == 0:
-				return id_added_list, False
-
-			curr_item = {"stream_id": jx['id'], "added": jx['added'], 'media_type': 'TV'}
-			id_added_list.append(curr_item)
-			print(curr_item)
-			return id_added_list, True
-
-		if type(vod_series.get('episodes',{})) == type([]):
-			if type(vod_series.get('episodes',{})[0]) == type([]):
-				seasons = 'episodes'
-				episodes_type = 'list'
-
-		if episodes_type == 'string':
-			for j in vod_series[seasons]:
-				try: test = vod_series[seasons][curr_season]
-				except: seasons = 'episodes'
-				if type(j) == type({}):
-					curr_season = str(j['season_number'])
-				else:
-					curr_season = str(j)
-				if vod_series.get(seasons,{}).get(curr_season,'') == '':
-					continue
-				for jx in vod_series[seasons][curr_season]:
-					try: var_test = i.get('tmdb',False)
-					except: var_test = False
-					if var_test:
-						id_added_list,episode_result = do_episode(id_added_list=id_added_list,ep_item=jx, tv_item=i, season_item=j)
-					else:
-						id_added_list,episode_result = do_episode(id_added_list=id_added_list,ep_item=jx, tv_item=vod_series['info'], season_item=j)
-					if episode_result == False:
-						continue
-			print(i['name'], ix,' of total shows ' , len(vod_TV))
-		else:
-			for j in vod_series[seasons]:
-				if i.get('tmdb','') != '':
-					tv_item = i
-				else:
-					tv_item = vod_series['info']
-				for jx in j:
-					if type(j) == type([]):
-						id_added_list,episode_result = do_episode(id_added_list=id_added_list,ep_item=jx, tv_item=tv_item, season_item=j[0])
-					else:
-						id_added_list,episode_result = do_episode(id_added_list=id_added_list,ep_item=jx, tv_item=tv_item, season_item=j)
-					if episode_result == False:
-						continue
-			print(i['name'], ix,' of total shows ' , len(vod_TV))
-
-	vod_json = VOD_json(VOD_API_URL)
-	for i in vod_json:
-		curr_item = {"stream_id": i['stream_id'], "added": i['added'], 'media_type': 'MOVIE'}
-		id_added_list.append(curr_item)
-		#print(1,curr_item )
-
-	db_remove_missing_on_json(id_added_list)
+def check_db_missing_on_json2():
+	#remove entries from the DB which are no longer present in the VOD json data
+	failed_series = []
+	return db_remove_missing_on_json(iter_valid_rows(failed_series), failed_series=failed_series)
 
 
 
 def tv_create_strm(vod_TV):
-	for ix, i in enumerate(vod_TV):
+	total_TV = catalog_total(vod_TV)
+	vod_TV_pending = (i for i in vod_TV if db_check_exists(id = get_series_id(i), title = i.last_modified, media_type='TV_SHOW') != True)
+	for ix, (i, vod_series) in enumerate(prefetch_series_info(vod_TV_pending)):
 		series_id = get_series_id(i)
-
-		tv_check_processed = db_check_exists(id = series_id, title = i['last_modified'], media_type='TV_SHOW')
-		if tv_check_processed == True:
-			continue
-		vod_series = VOD_json(get_series_info, series_id=series_id)
-		log_to_kodi(i['name'])
+		log_to_kodi(i.name)
 		if not vod_series or 'seasons' not in vod_series or 'episodes' not in vod_series:
+			hold_watermark('TV_SHOW', i.last_modified)
 			continue
 
-		seasons = 'episodes'
-		episodes_type = 'string'
-		for ib in vod_series['seasons']:
-			if 'season_number' in str(ib):
-				seasons = 'seasons'
-		if seasons == 'episodes':
-			for ic in vod_series['episodes']:
-				if type(ic) == type(''):
-					episodes_type = 'string'
-				elif type(ic) == type([]):
-					episodes_type = 'list'
-
 		def do_episode(ep_item, tv_item, season_item):
 			jx = ep_item
 			i = tv_item
@@ -778,17 +1025,20 @@ def tv_create_strm(vod_TV):
 			if j.get('season_number','') == '':
 				j['season_number'] = j['season']
 
-			check_title = jx['title'].replace("'",'')
-			if db_check_exists(id = jx['id'], title = check_title, media_type='TV'):
+			check_title = jx.title
+			if db_check_exists(id = jx.id, title = check_title, media_type='TV'):
 				return False
 			
 			result_list = []
 			cache_dict = {}
-			strm_url = f"{SERVER_ADD}/series/{USERNAME}/{PASSWORD}/{jx['id']}.{jx['container_extension']}"
-			if j['season_number'] != 0 and jx['episode_num'] != 0:
-				episode_info, tvshow = Utils.extended_episode_info(tvshow_id=i['tmdb'], season=j['season_number'], episode=jx['episode_num'], cache_time=7)
+			strm_url = f"{SERVER_ADD}/series/{USERNAME}/{PASSWORD}/{jx.id}.{jx.container_extension}"
+			if j['season_number'] != 0 and jx.episode_num != 0:
+				episode_info, tvshow = Utils.extended_episode_info(tvshow_id=i.tmdb, season=j['season_number'], episode=jx.episode_num, cache_time=7)
 			else:
 				return False
+			#None marks a TMDB lookup that failed, the show is retried on the next pass
+			if not episode_info or not tvshow:
+				return None
 
 			try:
 				if contains_non_english(tvshow['original_name']):
@@ -799,15 +1049,15 @@ def tv_create_strm(vod_TV):
 				try:
 					original_title = tvshow['name']
 				except:
-					return False
+					return None
 
 			original_title = Utils.make_safe_filename(original_title)
 			season_num = str(j['season_number']).zfill(2)
-			episode_num = str(jx['episode_num']).zfill(2)
+			episode_num = str(jx.episode_num).zfill(2)
 
-			folder_name = f"{original_title}.[tmdb={i['tmdb']}]/Season.{season_num}"
-			show_folder = f"{original_title}.[tmdb={i['tmdb']}]"
-			base_filename = f"{original_title}.S{season_num}E{episode_num}.[tmdb={i['tmdb']}]"
+			folder_name = f"{original_title}.[tmdb={i.tmdb}]/Season.{season_num}"
+			show_folder = f"{original_title}.[tmdb={i.tmdb}]"
+			base_filename = f"{original_title}.S{season_num}E{episode_num}.[tmdb={i.tmdb}]"
 
 			strm_episode_path = os.path.join(TVSHOWS_DIR, folder_name, f"{base_filename}.strm")
 			xml_episode_nfo_path = os.path.join(TVSHOWS_DIR, folder_name, f"{base_filename}.nfo")
@@ -815,102 +1065,72 @@ def tv_create_strm(vod_TV):
 			xml_tvshow_nfo_path = os.path.join(TVSHOWS_DIR, show_folder, show_folder + ".nfo")
 			xml_season_nfo_path = os.path.join(TVSHOWS_DIR, folder_name, "season.nfo")
 
-			nfo_url = f"https://www.themoviedb.org/tv/{i['tmdb']}"
-
-			with safe_open_w(strm_episode_path) as f:
-				f.write(strm_url)
-
-			with safe_open_w(nfo_url_path) as f:
-				f.write(nfo_url)
-
-			with safe_open_w(xml_episode_nfo_path) as f:
-				xml_episode_nfo = kodi_episode_nfo(episode_info, tvshow)
-				f.write(xml_episode_nfo)
-
-			with safe_open_w(xml_tvshow_nfo_path) as f:
-				xml_tvshow_nfo = kodi_tvshow_nfo(tvshow)
-				f.write(xml_tvshow_nfo)
+			nfo_url = f"https://www.themoviedb.org/tv/{i.tmdb}"
 
-			with safe_open_w(xml_season_nfo_path) as f:
-				xml_season_nfo = kodi_season_nfo(j, tvshow)
-				f.write(xml_season_nfo)
+			xml_episode_nfo = Render('episode', (episode_info, tvshow, TV_NFO_PROFILE))
+			xml_tvshow_nfo = cached_render('tvshow', i.tmdb, None, (tvshow,), partial(kodi_tvshow_nfo, profile=TV_NFO_PROFILE))
+			xml_season_nfo = cached_render('season', i.tmdb, j['season_number'], (j, tvshow), partial(kodi_season_nfo, profile=TV_NFO_PROFILE))
+			files = [(strm_episode_path, strm_url), (nfo_url_path, nfo_url), (xml_episode_nfo_path, xml_episode_nfo), (xml_tvshow_nfo_path, xml_tvshow_nfo), (xml_season_nfo_path, xml_season_nfo)]
 
 			result_list[:] = [*result_list, *[strm_url,nfo_url_path,nfo_url,xml_episode_nfo_path,xml_episode_nfo,xml_tvshow_nfo_path,xml_tvshow_nfo,xml_season_nfo]]
 			#result_list.append()
 
 			#log_to_kodi(result_list)
-			cache_dict['id'], cache_dict['tmdb_id'], cache_dict['added'], cache_dict['container_ext'],cache_dict['title'], cache_dict['strm_path'] = jx['id'], i['tmdb'], jx['added'], jx['container_extension'],check_title, strm_episode_path
+			cache_dict['id'], cache_dict['tmdb_id'], cache_dict['added'], cache_dict['container_ext'],cache_dict['title'], cache_dict['strm_path'] = jx.id, i.tmdb, jx.added, jx.container_extension,check_title, strm_episode_path
 			cache_dict['kodi_added'] = int(time.time())
 			cache_dict['media_type'] = 'TV'
-			cache_dict['updated'] = i['last_modified']
+			cache_dict['updated'] = i.last_modified
 			
 			#log_to_kodi(cache_dict)
-			db_update(cache_dict)
-			log_to_kodi(f"Created: {strm_episode_path}")
+			nfo_stage.submit(files, futures_out=show_jobs, lane_key=show_folder, row=cache_dict, message=f"Created: {strm_episode_path}")
 			return True
 
-		if type(vod_series.get('episodes',{})) == type([]):
-			if type(vod_series.get('episodes',{})[0]) == type([]):
-				seasons = 'episodes'
-				episodes_type = 'list'
-
-		if episodes_type == 'string':
-			for j in vod_series[seasons]:
-				try: test = vod_series[seasons][curr_season]
-				except: seasons = 'episodes'
-				if type(j) == type({}):
-					curr_season = str(j['season_number'])
-				else:
-					curr_season = str(j)
-				if vod_series.get(seasons,{}).get(curr_season,'') == '':
-					continue
-				for jx in vod_series[seasons][curr_season]:
-					try: var_test = i.get('tmdb',False)
-					except: var_test = False
-					if var_test:
-						episode_result = do_episode(ep_item=jx, tv_item=i, season_item=j)
-					else:
-						episode_result = do_episode(ep_item=jx, tv_item=vod_series['info'], season_item=j)
-					if episode_result == False:
-						continue
-			print(i['name'], ix,' of total shows ' , len(vod_TV))
+		if i.tmdb:
+			tv_item = i
 		else:
-			for j in vod_series[seasons]:
-				if i.get('tmdb','') != '':
-					tv_item = i
-				else:
-					tv_item = vod_series['info']
-				for jx in j:
-					if type(j) == type([]):
-						episode_result = do_episode(ep_item=jx, tv_item=tv_item, season_item=j[0])
-					else:
-						episode_result = do_episode(ep_item=jx, tv_item=tv_item, season_item=j)
-					if episode_result == False:
-						continue
-			print(i['name'], ix,' of total shows ' , len(vod_TV))
+			tv_item = records.SeriesEntry.from_json(vod_series['info'])
+		series_episodes = [(j, records.EpisodeEntry.from_json(jx)) for j, jx in iter_series_episodes(vod_series)]
+		Utils.resolve_tmdb_batch(('episode', tv_item.tmdb, season_number(j), jx.episode_num) for j, jx in series_episodes if season_number(j) != 0 and jx.episode_num != 0 and not db_check_exists(id = jx.id, title = jx.title, media_type='TV'))
+		show_jobs = []
+		episodes_failed = 0
+		for j, jx in series_episodes:
+			episode_result = do_episode(ep_item=jx, tv_item=tv_item, season_item=j)
+			if episode_result is None:
+				episodes_failed += 1
+			if episode_result == False:
+				continue
+		print(i.name, ix,' of total shows ' , total_TV)
+		if episodes_failed:
+			#without the show row the series is not skipped next time, the written episodes are skipped by their own rows
+			log_to_kodi(f"{i.name}: TMDB lookup failed for {episodes_failed} episodes, show not recorded")
+			hold_watermark('TV_SHOW', i.last_modified)
+			continue
 		cache_dict = {}
-		cache_dict['id'], cache_dict['tmdb_id'], cache_dict['added'], cache_dict['container_ext'],cache_dict['title'], cache_dict['strm_path'] = series_id, i['tmdb'], jx['added'], 'EXT_TV_SHOW','TITLE_TV_SHOW', 'STRM_TV_SHOW'
+		cache_dict['id'], cache_dict['tmdb_id'], cache_dict['added'], cache_dict['container_ext'],cache_dict['title'], cache_dict['strm_path'] = series_id, i.tmdb, jx.added, 'EXT_TV_SHOW','TITLE_TV_SHOW', 'STRM_TV_SHOW'
 		cache_dict['kodi_added'] = int(time.time())
 		cache_dict['media_type'] = 'TV_SHOW'
-		cache_dict['updated'] = i['last_modified']
+		cache_dict['updated'] = i.last_modified
 		#db_check_exists(id = series_id, title = i['updated'], media_type='TV_SHOW')
-		db_update(cache_dict)
+		#the show row is recorded once all of its episode files are written
+		#the stage hands jobs on in order, show_jobs is complete by the time this one reaches the writer
+		nfo_stage.submit(None, row=cache_dict, after=show_jobs)
+	log_to_kodi(f"Show/season NFOs: {render_stats['rendered']} rendered, {render_stats['saved']} renders saved by the render cache")
 
 
 
 def movie_create_strm(vod_movie):
 	vod_json = vod_movie
-	for i in vod_json:
-		log_to_kodi(i['name'])
-		check_title = i['name'].replace("'",'')
-		if db_check_exists(id = i['stream_id'], title = check_title, media_type='MOVIE'):
+	for i in prefetch_movie_info(vod_json):
+		log_to_kodi(i.name)
+		check_title = i.name
+		if db_check_exists(id = i.stream_id, title = check_title, media_type='MOVIE'):
 			continue
-		if i['stream_type'] == 'movie':
-			if i['tmdb'] == '':
+		if i.stream_type == 'movie':
+			if i.tmdb == '':
 				continue
 			result_list = []
 			cache_dict = {}
-			movie_info = Utils.single_movie_info(movie_id=i['tmdb'],cache_time=7)
+			movie_info = Utils.single_movie_info(movie_id=i.tmdb,cache_time=7)
 			try:
 				if contains_non_english(movie_info['original_title']):
 					original_title = movie_info['title']
@@ -918,107 +1138,97 @@ def movie_create_strm(vod_movie):
 					original_title = movie_info['original_title']
 			except:
 				try: original_title = movie_info['title']
-				except: continue
+				except:
+					hold_watermark('MOVIE', i.added)
+					continue
 			if original_title[:4].upper() in ['CON ', 'PRN ', 'AUX ', 'NUL ']:
 				original_title = Utils.make_safe_filename(original_title)
 				original_title = '.' + original_title 
 			else:
 				original_title = Utils.make_safe_filename(original_title)
-			if '4K' in i['name']:
+			if '4K' in i.name:
 				flag_4k = True
 			else:
 				flag_4k = False
-			#strm_movie_folder = '/%s.(%s).[tmdb=%s]' % (original_title, str(movie_info['release_date'][:4]), str(i['tmdb']))
+			#strm_movie_folder = '/%s.(%s).[tmdb=%s]' % (original_title, str(movie_info['release_date'][:4]), str(i.tmdb))
 			if flag_4k:
-				strm_movie_path = '%s.(%s).[tmdb=%s][4k]/%s.(%s).[tmdb=%s][4k].strm' % (original_title, str(movie_info['release_date'][:4]), str(i['tmdb']), original_title, str(movie_info['release_date'][:4]), str(i['tmdb']))
+				strm_movie_path = '%s.(%s).[tmdb=%s][4k]/%s.(%s).[tmdb=%s][4k].strm' % (original_title, str(movie_info['release_date'][:4]), str(i.tmdb), original_title, str(movie_info['release_date'][:4]), str(i.tmdb))
 			else:
-				strm_movie_path = '%s.(%s).[tmdb=%s]/%s.(%s).[tmdb=%s].strm' % (original_title, str(movie_info['release_date'][:4]), str(i['tmdb']), original_title, str(movie_info['release_date'][:4]), str(i['tmdb']))
+				strm_movie_path = '%s.(%s).[tmdb=%s]/%s.(%s).[tmdb=%s].strm' % (original_title, str(movie_info['release_date'][:4]), str(i.tmdb), original_title, str(movie_info['release_date'][:4]), str(i.tmdb))
 			strm_movie_path = os.path.join(str(MOVIES_DIR),strm_movie_path)
 			xml_movie_nfo_path = strm_movie_path.replace('.strm','.nfo')
-			nfo_movie_path = os.path.join(MOVIES_DIR, '%s.(%s).[tmdb=%s]/movie.nfo' % (original_title, str(movie_info['release_date'][:4]), str(i['tmdb'])))
-			nfo_url = 'https://www.themoviedb.org/movie/%s' % (str(i['tmdb']))
-
-			strm_url = f"{SERVER_ADD}/movie/{USERNAME}/{PASSWORD}/{i['stream_id']}.{i['container_extension']}"
-			with safe_open_w(strm_movie_path) as f:
-				f.write(strm_url)
-			with safe_open_w(nfo_movie_path) as f:
-				f.write(nfo_url)
-			xml = kodi_movie_nfo(movie_info)
-			with safe_open_w(xml_movie_nfo_path) as f:
-				f.write(xml)
+			nfo_movie_path = os.path.join(MOVIES_DIR, '%s.(%s).[tmdb=%s]/movie.nfo' % (original_title, str(movie_info['release_date'][:4]), str(i.tmdb)))
+			nfo_url = 'https://www.themoviedb.org/movie/%s' % (str(i.tmdb))
+
+			strm_url = f"{SERVER_ADD}/movie/{USERNAME}/{PASSWORD}/{i.stream_id}.{i.container_extension}"
+			xml = Render('movie', (movie_info, MOVIE_NFO_PROFILE))
+			files = [(strm_movie_path, strm_url), (nfo_movie_path, nfo_url), (xml_movie_nfo_path, xml)]
 			result_list.append(strm_movie_path)
 			result_list.append(nfo_movie_path)
 			result_list.append(nfo_url)
 			result_list.append(strm_url)
 			result_list.append(xml)
 
-			cache_dict['id'], cache_dict['tmdb_id'], cache_dict['added'], cache_dict['container_ext'],cache_dict['title'], cache_dict['strm_path'] = i['stream_id'], i['tmdb'], i['added'], i['container_extension'],check_title, strm_movie_path
+			cache_dict['id'], cache_dict['tmdb_id'], cache_dict['added'], cache_dict['container_ext'],cache_dict['title'], cache_dict['strm_path'] = i.stream_id, i.tmdb, i.added, i.container_extension,check_title, strm_movie_path
 			cache_dict['kodi_added'] = int(time.time())
 			cache_dict['media_type'] = 'MOVIE'
-			cache_dict['updated'] = i['added']
+			cache_dict['updated'] = i.added
 			log_to_kodi(cache_dict)
-			db_update(cache_dict)
-			log_to_kodi(f"Created: {strm_movie_path}")
+			#movie.nfo sits in the non 4k folder, that folder is the lane so both versions of a movie share it
+			nfo_stage.submit(files, lane_key=os.path.dirname(nfo_movie_path), row=cache_dict, message=f"Created: {strm_movie_path}")
 
 #check_db_missing_on_json2()
 #exit()
 
 
-def sort_nested(data, sort_key, asc=True):
-	# Helper to recursively find the sort_key in nested structures
-	def find_key(obj):
-		if isinstance(obj, dict):
-			if sort_key in obj:
-				return obj[sort_key]
-			for value in obj.values():
-				result = find_key(value)
-				if result is not None:
-					return result
-		elif isinstance(obj, list):
-			for item in obj:
-				result = find_key(item)
-				if result is not None:
-					return result
-		return None
-
-	# Determine if input is a list or dict and sort accordingly
-	if isinstance(data, dict):
-		sorted_items = sorted(data.items(), key=lambda item: find_key(item[1]), reverse=not asc)
-		return dict(sorted_items)
-	elif isinstance(data, list):
-		return sorted(data, key=lambda item: find_key(item), reverse=not asc)
-	else:
-		raise TypeError("Input must be a list or dictionary")
- 
-
-
-
-
-vod_TV = VOD_json(SERIES_API_URL)
-vod_TV = sort_nested(vod_TV,'last_modified',False)
-#for ix, i in enumerate(vod_TV):
-#	print(i['name'])
-#	print(i['last_modified'])
-#	if ix > 100:
-#		break
-
-
-vod_movie = VOD_json(VOD_API_URL)
-vod_movie = sort_nested(vod_movie,'added',False)
-#for ix, i in enumerate(vod_movie):
-#	print(i['name'])
-#	print(i['added'])
-#	if ix > 100:
-#		break
-#exit()
-
-#vod_TV = VOD_json(SERIES_API_URL)
-#vod_movie = VOD_json(VOD_API_URL)
-tv_create_strm(vod_TV)
-movie_create_strm(vod_movie)
-
 def main():
-	return
+	nfo_stage.start()
+	tv_full, tv_watermark = sync_plan('TV_SHOW')
+	movie_full, movie_watermark = sync_plan('MOVIE')
+	if CATALOG_DIFF:
+		#added / changed entries go to the STRM creator, removed ones are dropped from PROCESSED before it runs
+		vod_TV = diff_catalog(catalog_records(SERIES_API_URL, records.SeriesEntry), 'TV_SHOW', full=tv_full)
+		vod_movie = diff_catalog(catalog_records(VOD_API_URL, records.VodEntry), 'MOVIE', full=movie_full)
+	else:
+		vod_TV = newer_than(catalog_records(SERIES_API_URL, records.SeriesEntry), 'TV_SHOW', tv_watermark)
+		vod_movie = newer_than(catalog_records(VOD_API_URL, records.VodEntry), 'MOVIE', movie_watermark)
+	#the sync limit only applies to incremental passes, the heap holds at most SYNC_LIMIT records even when streaming
+	#entries past the limit are older than the new watermark, the next full pass has no limit and picks them up
+	tv_limit = 0 if tv_full else SYNC_LIMIT
+	movie_limit = 0 if movie_full else SYNC_LIMIT
+	if not STREAM_CATALOG or tv_limit:
+		vod_TV = order_catalog(vod_TV, 'last_modified', limit=tv_limit)
+	if not STREAM_CATALOG or movie_limit:
+		vod_movie = order_catalog(vod_movie, 'added', limit=movie_limit)
+	#for ix, i in enumerate(vod_TV):
+	#	print(i['name'])
+	#	print(i['last_modified'])
+	#	if ix > 100:
+	#		break
+
+	#for ix, i in enumerate(vod_movie):
+	#	print(i['name'])
+	#	print(i['added'])
+	#	if ix > 100:
+	#		break
+	#exit()
+
+	#vod_TV = VOD_json(SERIES_API_URL)
+	#vod_movie = VOD_json(VOD_API_URL)
+	try:
+		tv_create_strm(vod_TV)
+		flush_writes()
+		save_watermark('TV_SHOW', tv_full)
+		save_snapshot('TV_SHOW')
+		movie_create_strm(vod_movie)
+		flush_writes()
+		save_watermark('MOVIE', movie_full)
+		save_snapshot('MOVIE')
+		remove_stale_paths('MOVIE')
+	finally:
+		nfo_stage.close()
+		file_writer.close()
+		db_flush()
 
 if __name__ == '__main__':
 	main()
@@ -0,0 +1,76 @@
+"""
+Shared setup for the benchmark scripts, run them from the repo root, e.g. python bench/processed_lookup.py >> bench_output.txt
+Importing addon.py reads the settings and opens the cache DB, load_addon_functions compiles only the named top level functions out of it.
+"""
+import ast
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADDON_PY = os.path.join(ROOT, 'addon.py')
+NFO_PAYLOADS = os.path.join(ROOT, 'tests', 'fixtures', 'nfo', 'payloads.json')
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'resources', 'lib')]
+
+
+def load_addon_functions(names, namespace):
+	with open(ADDON_PY, encoding='utf-8') as f:
+		tree = ast.parse(f.read(), ADDON_PY)
+	nodes = [i for i in tree.body if isinstance(i, ast.FunctionDef) and i.name in names]
+	missing = set(names) - {i.name for i in nodes}
+	if missing:
+		raise LookupError('Not found in addon.py: %s' % ', '.join(sorted(missing)))
+	exec(compile(ast.Module(body=nodes, type_ignores=[]), ADDON_PY, 'exec'), namespace)
+	return namespace
+
+def provider_body(count):
+	#the usual get_vod_streams entry shape, fields the pipeline never reads included
+	return json.dumps([{'num': i, 'name': 'Movie %s (2020)' % i, 'stream_type': 'movie', 'stream_id': 100000 + i,
+		'stream_icon': 'http://img.example/%s.jpg' % i, 'rating': '6.5', 'rating_5based': 3.25, 'tmdb': str(i),
+		'trailer': '', 'added': str(1600000000 + i), 'is_adult': 0, 'category_id': str(i % 40), 'category_ids': [i % 40],
+		'container_extension': 'mkv', 'custom_sid': None, 'direct_source': ''} for i in range(count)])
+
+def nfo_payloads():
+	#the real sized TMDB payloads the NFO golden tests render, {case: {'kind': ..., 'args': [...]}}
+	with open(NFO_PAYLOADS, encoding='utf-8') as f:
+		return json.load(f)
+
+def nfo_jobs(kind, count, case=None):
+	#count distinct argument lists for one NFO kind, every job gets its own copy of the payload like a real library
+	text = json.dumps(nfo_payloads()[case or kind]['args'])
+	jobs = []
+	for i in range(count):
+		args = json.loads(text)
+		args[0]['id'] = i
+		jobs.append(args)
+	return jobs
+
+def tmdb_person(k):
+	return {'name': 'Actor Name %d' % k, 'character': 'Character %d' % k, 'profile_path': '/prof%d.jpg' % k, 'job': ['Writer', 'Director', 'Producer', 'Editor'][k % 4],
+		'known_for_department': 'Acting', 'credit_id': 'x' * 24, 'original_name': 'Actor Name %d' % k, 'popularity': 1.5, 'gender': 2, 'adult': False}
+
+def tmdb_image(k):
+	return {'file_path': '/img%d.jpg' % k, 'width': 1920, 'height': 1080, 'aspect_ratio': 1.77, 'vote_average': 5.3, 'vote_count': 4, 'iso_639_1': 'en'}
+
+def tmdb_payloads():
+	"""
+	Real sized TMDB payloads with the append_to_response blocks the addon asks for, returns {kind: args}.
+	A long running show: 60 cast, 150 crew, 150 images and 30 alternative titles, a movie with 80 cast and 200 crew.
+	"""
+	show = {'id': 1399, 'name': 'Game of Thrones', 'original_name': 'Game of Thrones', 'overview': 'Seven noble families fight for control of the mythical land of Westeros. ' * 4,
+		'tagline': 'Winter is coming', 'status': 'Ended', 'first_air_date': '2011-04-17', 'vote_average': 8.4, 'vote_count': 21000, 'number_of_seasons': 8, 'number_of_episodes': 73,
+		'episode_run_time': [60], 'poster_path': '/p.jpg', 'backdrop_path': '/b.jpg', 'external_ids': {'imdb_id': 'tt0944947', 'tvdb_id': 121361},
+		'genres': [{'id': 1, 'name': 'Sci-Fi & Fantasy'}, {'id': 2, 'name': 'Drama'}, {'id': 3, 'name': 'Action & Adventure'}], 'networks': [{'name': 'HBO', 'logo_path': '/h.png'}],
+		'content_ratings': {'results': [{'iso_3166_1': c, 'rating': 'TV-MA'} for c in ['GB', 'DE', 'US', 'FR']]},
+		'seasons': [{'season_number': n, 'name': 'Season %d' % n, 'poster_path': '/s%d.jpg' % n, 'overview': 'o' * 300, 'air_date': '2011-04-17', 'episode_count': 10} for n in range(0, 9)],
+		'credits': {'cast': [tmdb_person(k) for k in range(60)], 'crew': [tmdb_person(k) for k in range(150)]},
+		'images': {'backdrops': [tmdb_image(k) for k in range(60)], 'logos': [tmdb_image(k) for k in range(10)], 'posters': [tmdb_image(k) for k in range(80)]},
+		'alternative_titles': {'results': [{'title': 'Juego de tronos %d' % k, 'iso_3166_1': 'ES'} for k in range(30)]}}
+	episode = {'id': 63056, 'name': 'Winter Is Coming', 'overview': 'Lord Eddard Stark is torn between his family and an old friend. ' * 3, 'season_number': 1, 'episode_number': 1,
+		'air_date': '2011-04-17', 'runtime': 62, 'vote_average': 7.9, 'vote_count': 300, 'still_path': '/st.jpg', 'crew': [tmdb_person(k) for k in range(25)],
+		'guest_stars': [tmdb_person(k) for k in range(20)], 'external_ids': {'imdb_id': 'tt1480055', 'tvdb_id': 3254641}}
+	movie = dict(show, title='The Movie', original_title='The Movie', release_date='2010-07-15', runtime=148, production_countries=[{'name': 'United States of America'}],
+		production_companies=[{'name': 'Studio %d' % k} for k in range(5)], belongs_to_collection=None,
+		release_dates={'results': [{'iso_3166_1': 'US', 'release_dates': [{'certification': 'PG-13'}]}]},
+		credits={'cast': [tmdb_person(k) for k in range(80)], 'crew': [tmdb_person(k) for k in range(200)]})
+	return {'movie': (movie,), 'tvshow': (show,), 'season': (show['seasons'][1], show), 'episode': (episode, show)}
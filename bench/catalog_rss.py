@@ -0,0 +1,51 @@
+"""
+Peak RSS of parsing a 100k entry get_vod_streams body (user-011), json.loads plus the newest first sort vs the streaming iter_json_array.
+Each mode runs in its own process so ru_maxrss is not shared, the growth is reported above the peak with just the body loaded.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import _common
+from _common import provider_body
+
+ENTRIES = 100000
+
+
+def peak_kb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def run(mode, path):
+	if mode == 'write':
+		with open(path, 'w', encoding='utf-8') as f:
+			f.write(provider_body(ENTRIES))
+		return
+	namespace = _common.load_addon_functions(['iter_json_array'], {'json': json})
+	with open(path, encoding='utf-8') as f:
+		body = f.read()
+	base = peak_kb()
+	if mode == 'loads':
+		entries = sorted(json.loads(body), key=lambda i: int(i['added']), reverse=True)
+		count = len(entries)
+	else:
+		count = sum(1 for i in namespace['iter_json_array'](body))
+	print('%-6s %d entries, body %.0f MB, peak %.0f MB, +%.0f MB over the body' % (mode, count, len(body) / 1e6, peak_kb() / 1024, (peak_kb() - base) / 1024))
+
+def main():
+	#the body is built in a process of its own too, a child forked from a large parent starts with the parent's peak
+	with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+		pass
+	try:
+		for mode in ('write', 'loads', 'stream'):
+			subprocess.run([sys.executable, __file__, mode, f.name], check=True)
+	finally:
+		os.remove(f.name)
+
+if __name__ == '__main__':
+	if len(sys.argv) > 2:
+		run(sys.argv[1], sys.argv[2])
+	else:
+		main()
@@ -0,0 +1,64 @@
+"""
+os.stat / os.mkdir calls made while writing a fresh library (user-020), mkdir_p with and without the known_dirs cache.
+strace is not needed, the calls are counted by wrapping the os functions the writer goes through.
+"""
+import errno
+import os
+import shutil
+import tempfile
+
+import _common
+
+SERIES = 100
+EPISODES = 50
+MOVIES = 500
+
+
+class NeverKnown(set):
+	#stands in for known_dirs to get the old mkdir_p, which went to os.makedirs for every file
+	def __contains__(self, item):
+		return False
+
+def library_files(root):
+	for s in range(SERIES):
+		show = os.path.join(root, 'tv', 'Show %s.[tmdb=%s]' % (s, s))
+		for e in range(EPISODES):
+			season = os.path.join(show, 'Season.%02d' % (e // 10 + 1))
+			base = os.path.join(season, 'Show %s.S%02dE%02d' % (s, e // 10 + 1, e + 1))
+			yield from (base + '.strm', base + '.nfo', os.path.join(show, 'tvshow.nfo'), os.path.join(season, 'season.nfo'))
+	for m in range(MOVIES):
+		folder = os.path.join(root, 'movies', 'Movie %s.(2020).[tmdb=%s]' % (m, m))
+		yield from (os.path.join(folder, 'Movie %s.strm' % m), os.path.join(folder, 'Movie %s.nfo' % m), os.path.join(folder, 'movie.nfo'))
+
+def count_calls(known_dirs):
+	namespace = _common.load_addon_functions(['mkdir_p', 'safe_open_w', 'write_files'], {'os': os, 'errno': errno, 'known_dirs': known_dirs})
+	counts = {'stat': 0, 'mkdir': 0}
+	real = {name: getattr(os, name) for name in counts}
+
+	def counted(name):
+		def call(*args, **kwargs):
+			counts[name] += 1
+			return real[name](*args, **kwargs)
+		return call
+
+	root = tempfile.mkdtemp()
+	files = 0
+	try:
+		for name in counts:
+			setattr(os, name, counted(name))
+		for path in library_files(root):
+			namespace['write_files']([(path, '')])
+			files += 1
+	finally:
+		for name, func in real.items():
+			setattr(os, name, func)
+		shutil.rmtree(root)
+	return files, counts
+
+def main():
+	for label, known_dirs in (('no cache', NeverKnown()), ('known_dirs', set())):
+		files, counts = count_calls(known_dirs)
+		print('%-10s %d files: %d stat, %d mkdir calls' % (label, files, counts['stat'], counts['mkdir']))
+
+if __name__ == '__main__':
+	main()
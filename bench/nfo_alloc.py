@@ -0,0 +1,56 @@
+"""
+Allocation of whole payload transliteration vs the per field transliteration in nfo.py (user-022), measured with tracemalloc.
+Before clones the payload the way the old builders did (bench/nfo_etree.py) and renders the clone, after renders the payload as it is.
+Cast names and plots carry non ASCII text, so both sides have transliteration work to do.
+"""
+import re
+import time
+import tracemalloc
+
+import _common
+import nfo
+import nfo_etree
+
+SECONDS = 1.5
+DATEADDED = re.compile(r'<dateadded>[^<]*</dateadded>')
+
+
+def non_ascii(payloads):
+	episode, show = payloads['episode']
+	movie, = payloads['movie']
+	for person in show['credits']['cast'] + show['credits']['crew'] + movie['credits']['cast'] + episode['guest_stars']:
+		person['name'] = 'Nikolaj Coster-Waldau Ø%s' % person['name'][-2:]
+	show['overview'] = movie['overview'] = 'Sieben Adelsfamilien kämpfen um Westeros. ' * 4
+	return payloads
+
+def cloned(kind):
+	#the old builders copied every argument before reading a field, the season builder stripped instead of transliterating
+	clone = nfo_etree.strip_non_ascii if kind == 'season' else nfo_etree.remove_non_ascii
+	render = nfo.RENDERERS[kind]
+	return lambda *args: render(*[clone(i) for i in args])
+
+def peak(render, args):
+	tracemalloc.start()
+	render(*args)
+	size = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return size
+
+def rate(render, args):
+	count = 0
+	start = time.perf_counter()
+	while time.perf_counter() - start < SECONDS:
+		render(*args)
+		count += 1
+	return count / (time.perf_counter() - start)
+
+def main():
+	for kind, args in non_ascii(_common.tmdb_payloads()).items():
+		before, after = cloned(kind), nfo.RENDERERS[kind]
+		assert DATEADDED.sub('', before(*args)) == DATEADDED.sub('', after(*args)), kind
+		#the first render fills the transliteration cache, the peaks are taken once it is warm like in a sync
+		print('%-8s whole payload peak %6.0f KB %6.0f/s | per field peak %5.0f KB %6.0f/s' % (kind,
+			peak(before, args) / 1024, rate(before, args), peak(after, args) / 1024, rate(after, args)))
+
+if __name__ == '__main__':
+	main()
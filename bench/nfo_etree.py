@@ -0,0 +1,382 @@
+"""
+Frozen copy of the ElementTree NFO builders nfo.py replaced (user-021), kept only as the baseline of the NFO benchmarks.
+The functions are as they were in addon.py, the season builder's local strip copy is hoisted to strip_non_ascii so it can be timed on its own.
+"""
+from datetime import datetime
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+from unidecode import unidecode
+
+
+def remove_non_ascii(obj):
+	"""Recursively remove non-ASCII characters from all strings in a dict/list/str structure."""
+	if isinstance(obj, dict):
+		return {remove_non_ascii(k): remove_non_ascii(v) for k, v in obj.items()}
+	elif isinstance(obj, list):
+		return [remove_non_ascii(i) for i in obj]
+	elif isinstance(obj, str):
+		return unidecode(obj)
+	else:
+		return obj
+
+def strip_non_ascii(data):
+	if isinstance(data, dict):
+		return {k: strip_non_ascii(v) for k, v in data.items()}
+	elif isinstance(data, list):
+		return [strip_non_ascii(item) for item in data]
+	elif isinstance(data, str):
+		return ''.join(c for c in data if ord(c) < 128)
+	return data
+
+def kodi_movie_nfo(meta):
+	meta = remove_non_ascii(meta)
+	root = Element('movie')
+	SubElement(root, 'title').text = meta.get('title', '')
+	SubElement(root, 'originaltitle').text = meta.get('original_title', meta.get('title', ''))
+
+	sorttitle = meta.get('title', '')
+	if meta.get('belongs_to_collection'):
+		sorttitle = meta['belongs_to_collection'].get('name', sorttitle)
+	SubElement(root, 'sorttitle').text = sorttitle
+
+	ratings = SubElement(root, 'ratings')
+	imdb_id = meta.get('external_ids', {}).get('imdb_id')
+	if imdb_id:
+		rating = SubElement(ratings, 'rating', name='imdb', max='10', default='true')
+		SubElement(rating, 'value').text = str(meta.get('vote_average', ''))
+		SubElement(rating, 'votes').text = str(meta.get('vote_count', ''))
+	rating_tmdb = SubElement(ratings, 'rating', name='themoviedb', max='10')
+	SubElement(rating_tmdb, 'value').text = str(meta.get('vote_average', ''))
+	SubElement(rating_tmdb, 'votes').text = str(meta.get('vote_count', ''))
+	rating_trakt = SubElement(ratings, 'rating', name='trakt', max='10')
+	SubElement(rating_trakt, 'value').text = ''
+	SubElement(rating_trakt, 'votes').text = ''
+
+	SubElement(root, 'userrating').text = str(meta.get('vote_average', ''))
+	SubElement(root, 'top250').text = '0'
+	SubElement(root, 'outline').text = ''
+	SubElement(root, 'plot').text = meta.get('overview', '')
+	SubElement(root, 'tagline').text = meta.get('tagline', '')
+	SubElement(root, 'runtime').text = str(meta.get('runtime', ''))
+
+	poster_path = meta.get('poster_path')
+	backdrop_path = meta.get('backdrop_path')
+	if poster_path:
+		SubElement(root, 'thumb', aspect='poster', preview=f"https://image.tmdb.org/t/p/original{poster_path}").text = f"https://image.tmdb.org/t/p/original{poster_path}"
+	if backdrop_path:
+		SubElement(root, 'thumb', aspect='landscape', preview=f"https://image.tmdb.org/t/p/original{backdrop_path}").text = f"https://image.tmdb.org/t/p/original{backdrop_path}"
+		fanart = SubElement(root, 'fanart')
+		SubElement(fanart, 'thumb', preview=f"https://image.tmdb.org/t/p/w780{backdrop_path}").text = f"https://image.tmdb.org/t/p/original{backdrop_path}"
+
+	mpaa = ''
+	for rel in meta.get('release_dates', {}).get('results', []):
+		if rel.get('iso_3166_1') == 'US':
+			for r in rel.get('release_dates', []):
+				if r.get('certification'):
+					mpaa = r.get('certification')
+					break
+	SubElement(root, 'mpaa').text = mpaa
+	SubElement(root, 'playcount').text = '0'
+	SubElement(root, 'lastplayed').text = ''
+	SubElement(root, 'id').text = str(meta.get('id', ''))
+	if imdb_id:
+		SubElement(root, 'uniqueid', type='imdb').text = imdb_id
+	SubElement(root, 'uniqueid', type='tmdb', default='true').text = str(meta.get('id', ''))
+
+	for g in meta.get('genres', []):
+		SubElement(root, 'genre').text = g.get('name', '')
+	for c in meta.get('production_countries', []):
+		SubElement(root, 'country').text = c.get('name', '')
+
+	if meta.get('belongs_to_collection'):
+		set_el = SubElement(root, 'set')
+		SubElement(set_el, 'name').text = meta['belongs_to_collection'].get('name', '')
+		SubElement(set_el, 'overview').text = ''
+
+	for w in meta.get('credits', {}).get('crew', []):
+		if w.get('job', '').lower() == 'writer':
+			SubElement(root, 'credits').text = w.get('name', '')
+	for d in meta.get('credits', {}).get('crew', []):
+		if d.get('job', '').lower() == 'director':
+			SubElement(root, 'director').text = d.get('name', '')
+
+	SubElement(root, 'premiered').text = meta.get('release_date', '')
+	SubElement(root, 'year').text = (meta.get('release_date') or '')[:4]
+	SubElement(root, 'status').text = ''
+	SubElement(root, 'code').text = ''
+	SubElement(root, 'aired').text = ''
+
+	for s in meta.get('production_companies', []):
+		SubElement(root, 'studio').text = s.get('name', '')
+	SubElement(root, 'trailer').text = ''
+
+	for idx, actor in enumerate(meta.get('credits', {}).get('cast', [])):
+		actor_el = SubElement(root, 'actor')
+		SubElement(actor_el, 'name').text = actor.get('name', '')
+		SubElement(actor_el, 'role').text = actor.get('character', '')
+		SubElement(actor_el, 'order').text = str(idx)
+		if actor.get('profile_path'):
+			SubElement(actor_el, 'thumb').text = f"https://image.tmdb.org/t/p/original{actor['profile_path']}"
+
+	resume = SubElement(root, 'resume')
+	SubElement(resume, 'position').text = '0.000000'
+	SubElement(resume, 'total').text = '0.000000'
+	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
+
+def kodi_tvshow_nfo(meta):
+	meta = remove_non_ascii(meta)
+	root = Element('tvshow')
+	SubElement(root, 'title').text = meta.get('name', '')
+	SubElement(root, 'originaltitle').text = meta.get('original_name', meta.get('name', ''))
+	SubElement(root, 'showtitle').text = meta.get('name', '')
+
+	ratings = SubElement(root, 'ratings')
+	imdb_id = meta.get('external_ids', {}).get('imdb_id')
+	tvdb_id = meta.get('external_ids', {}).get('tvdb_id')
+	tmdb_id = meta.get('id')
+
+	rating_imdb = SubElement(ratings, 'rating', name='imdb', max='10', default='true')
+	SubElement(rating_imdb, 'value').text = ''
+	SubElement(rating_imdb, 'votes').text = ''
+	rating_tmdb = SubElement(ratings, 'rating', name='tmdb', max='10')
+	SubElement(rating_tmdb, 'value').text = str(meta.get('vote_average', ''))
+	SubElement(rating_tmdb, 'votes').text = str(meta.get('vote_count', ''))
+	rating_trakt = SubElement(ratings, 'rating', name='trakt', max='10')
+	SubElement(rating_trakt, 'value').text = ''
+	SubElement(rating_trakt, 'votes').text = ''
+
+	SubElement(root, 'userrating').text = str(meta.get('vote_average', ''))
+	SubElement(root, 'top250').text = '0'
+	SubElement(root, 'season').text = str(meta.get('number_of_seasons', ''))
+	SubElement(root, 'episode').text = str(meta.get('number_of_episodes', ''))
+	SubElement(root, 'displayseason').text = '-1'
+	SubElement(root, 'displayepisode').text = '-1'
+	SubElement(root, 'outline').text = ''
+	SubElement(root, 'plot').text = meta.get('overview', '')
+	SubElement(root, 'tagline').text = meta.get('tagline', '')
+	runtime = meta.get('episode_run_time', ['0'])[0] if meta.get('episode_run_time') else '0'
+	SubElement(root, 'runtime').text = str(runtime)
+
+	poster_path = meta.get('poster_path')
+	backdrop_path = meta.get('backdrop_path')
+	logo_path = ''
+	if meta.get('images'):
+		logos = meta['images'].get('logos', [])
+		if logos:
+			logo_path = logos[0].get('file_path', '')
+
+	if backdrop_path:
+		SubElement(root, 'thumb', aspect='landscape', preview=f"https://image.tmdb.org/t/p/w780{backdrop_path}").text = f"https://image.tmdb.org/t/p/original{backdrop_path}"
+	if logo_path:
+		SubElement(root, 'thumb', aspect='logos', preview=f"https://image.tmdb.org/t/p/w780{logo_path}").text = f"https://image.tmdb.org/t/p/original{logo_path}"
+	if poster_path:
+		SubElement(root, 'thumb', aspect='poster', preview=f"https://image.tmdb.org/t/p/w780{poster_path}").text = f"https://image.tmdb.org/t/p/original{poster_path}"
+
+	for season_data in meta.get('seasons', []):
+		s_poster = season_data.get('poster_path')
+		s_num = season_data.get('season_number')
+		if s_poster and s_num is not None:
+			SubElement(root, 'thumb', season=str(s_num), type='season', aspect='poster', preview=f"https://image.tmdb.org/t/p/w780{s_poster}").text = f"https://image.tmdb.org/t/p/original{s_poster}"
+
+	fanart = SubElement(root, 'fanart')
+	fanart_paths = []
+	if meta.get('images'):
+		fanart_paths = [img['file_path'] for img in meta['images'].get('backdrops', [])[:2] if img.get('file_path')]
+	elif backdrop_path:
+		fanart_paths = [backdrop_path]
+	for fpath in fanart_paths:
+		SubElement(fanart, 'thumb', preview=f"https://image.tmdb.org/t/p/original{fpath}").text = f"https://image.tmdb.org/t/p/original{fpath}"
+
+	mpaa = ''
+	for rel in meta.get('content_ratings', {}).get('results', []):
+		if rel.get('iso_3166_1') == 'US' and rel.get('rating'):
+			mpaa = f"US:{rel['rating']}"
+			break
+		elif rel.get('iso_3166_1') and rel.get('rating'):
+			mpaa = f"{rel['iso_3166_1']}:{rel['rating']}"
+	SubElement(root, 'mpaa').text = mpaa
+	SubElement(root, 'playcount').text = '0'
+	SubElement(root, 'lastplayed').text = ''
+	SubElement(root, 'id').text = str(tmdb_id or '')
+
+	if imdb_id:
+		SubElement(root, 'uniqueid', type='imdb').text = imdb_id
+	if tmdb_id:
+		SubElement(root, 'uniqueid', type='tmdb', default='true').text = str(tmdb_id)
+	if tvdb_id:
+		SubElement(root, 'uniqueid', type='tvdb').text = str(tvdb_id)
+
+	for g in meta.get('genres', []):
+		SubElement(root, 'genre').text = g.get('name', '')
+
+	premiered = meta.get('first_air_date', '')
+	SubElement(root, 'premiered').text = premiered
+	SubElement(root, 'year').text = premiered[:4] if premiered else ''
+	SubElement(root, 'status').text = meta.get('status', '')
+	SubElement(root, 'code').text = ''
+	SubElement(root, 'aired').text = ''
+
+	for s in meta.get('networks', []):
+		SubElement(root, 'studio').text = s.get('name', '')
+	SubElement(root, 'trailer').text = ''
+
+	for idx, actor in enumerate(meta.get('credits', {}).get('cast', [])):
+		actor_el = SubElement(root, 'actor')
+		SubElement(actor_el, 'name').text = actor.get('name', '')
+		SubElement(actor_el, 'role').text = actor.get('character', '')
+		SubElement(actor_el, 'order').text = str(idx)
+		if actor.get('profile_path'):
+			SubElement(actor_el, 'thumb').text = f"https://image.tmdb.org/t/p/original{actor['profile_path']}"
+
+	for season_data in meta.get('seasons', []):
+		if season_data.get('season_number') is not None and season_data.get('name'):
+			namedseason = SubElement(root, 'namedseason')
+			namedseason.set('number', str(season_data['season_number']))
+			namedseason.text = season_data['name']
+
+	resume = SubElement(root, 'resume')
+	SubElement(resume, 'position').text = '0.000000'
+	SubElement(resume, 'total').text = '0.000000'
+	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
+
+
+def kodi_season_nfo(season, tvshow):
+	season = strip_non_ascii(season)
+	tvshow = strip_non_ascii(tvshow)
+
+	root = Element('season')
+	SubElement(root, 'title').text = f"{tvshow.get('name', '')} - {season.get('name', '')}"
+	SubElement(root, 'plot').text = season.get('overview', '')
+	SubElement(root, 'season').text = str(season.get('season_number', ''))
+	SubElement(root, 'year').text = (season.get('air_date') or '')[:4]
+	SubElement(root, 'id').text = str(season.get('id', ''))
+	SubElement(root, 'tvshowid').text = str(tvshow.get('id', ''))
+
+	# Poster thumbnail
+	poster_path = season.get('poster_path')
+	if poster_path:
+		SubElement(root, 'thumb', aspect='poster', preview=f"https://image.tmdb.org/t/p/w780{poster_path}").text = f"https://image.tmdb.org/t/p/original{poster_path}"
+
+	# Fanart from TV show
+	fanart = SubElement(root, 'fanart')
+	backdrops = tvshow.get('images', {}).get('backdrops', [])
+	for backdrop in backdrops[:2]:
+		path = backdrop.get('file_path')
+		if path:
+			SubElement(fanart, 'thumb', preview=f"https://image.tmdb.org/t/p/original{path}").text = f"https://image.tmdb.org/t/p/original{path}"
+
+	# Ratings
+	ratings = SubElement(root, 'ratings')
+	rating_tmdb = SubElement(ratings, 'rating', name='tmdb', max='10', default='true')
+	SubElement(rating_tmdb, 'value').text = str(tvshow.get('vote_average', ''))
+	SubElement(rating_tmdb, 'votes').text = str(tvshow.get('vote_count', ''))
+
+	# Genres
+	for genre in tvshow.get('genres', []):
+		SubElement(root, 'genre').text = genre.get('name', '')
+
+	# Studios (networks)
+	for network in tvshow.get('networks', []):
+		SubElement(root, 'studio').text = network.get('name', '')
+
+	# Named season
+	if season.get('season_number') is not None and season.get('name'):
+		namedseason = SubElement(root, 'namedseason')
+		namedseason.set('number', str(season.get('season_number')))
+		namedseason.text = season.get('name')
+
+	# Resume block
+	resume = SubElement(root, 'resume')
+	SubElement(resume, 'position').text = '0.000000'
+	SubElement(resume, 'total').text = '0.000000'
+
+	# Date added
+	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
+
+
+def kodi_episode_nfo(episode, tvshow):
+	episode = remove_non_ascii(episode)
+	tvshow = remove_non_ascii(tvshow)
+
+	root = Element('episodedetails')
+	SubElement(root, 'title').text = episode.get('name', '')
+	SubElement(root, 'showtitle').text = tvshow.get('name', '')
+	SubElement(root, 'season').text = str(episode.get('season_number', ''))
+	SubElement(root, 'episode').text = str(episode.get('episode_number', ''))
+	SubElement(root, 'displayseason').text = '-1'
+	SubElement(root, 'displayepisode').text = '-1'
+	SubElement(root, 'aired').text = episode.get('air_date', '')
+	SubElement(root, 'plot').text = episode.get('overview', '')
+	SubElement(root, 'tagline').text = ''
+	SubElement(root, 'runtime').text = str(episode.get('runtime', ''))
+	SubElement(root, 'mpaa').text = ''
+	SubElement(root, 'playcount').text = '0'
+	SubElement(root, 'lastplayed').text = ''
+	SubElement(root, 'id').text = str(episode.get('id', ''))
+
+	imdb_id = episode.get('external_ids', {}).get('imdb_id')
+	tmdb_id = episode.get('id')
+	tvdb_id = episode.get('external_ids', {}).get('tvdb_id')
+	if imdb_id:
+		SubElement(root, 'uniqueid', type='imdb').text = imdb_id
+	if tmdb_id:
+		SubElement(root, 'uniqueid', type='tmdb', default='true').text = str(tmdb_id)
+	if tvdb_id:
+		SubElement(root, 'uniqueid', type='tvdb').text = str(tvdb_id)
+
+	ratings = SubElement(root, 'ratings')
+	rating_imdb = SubElement(ratings, 'rating', name='imdb', max='10', default='true')
+	SubElement(rating_imdb, 'value').text = str(episode.get('vote_average', ''))
+	SubElement(rating_imdb, 'votes').text = str(episode.get('vote_count', ''))
+	rating_tmdb = SubElement(ratings, 'rating', name='tmdb', max='10')
+	SubElement(rating_tmdb, 'value').text = str(episode.get('vote_average', ''))
+	SubElement(rating_tmdb, 'votes').text = str(episode.get('vote_count', ''))
+	rating_trakt = SubElement(ratings, 'rating', name='trakt', max='10')
+	SubElement(rating_trakt, 'value').text = ''
+	SubElement(rating_trakt, 'votes').text = ''
+	SubElement(root, 'userrating').text = '0'
+	SubElement(root, 'top250').text = '0'
+
+	for g in tvshow.get('genres', []):
+		SubElement(root, 'genre').text = g.get('name', '')
+
+	for w in episode.get('crew', []):
+		if w.get('job', '').lower() == 'writer':
+			SubElement(root, 'credits').text = w.get('name', '')
+	for d in episode.get('crew', []):
+		if d.get('job', '').lower() == 'director':
+			SubElement(root, 'director').text = d.get('name', '')
+
+	for s in tvshow.get('networks', []):
+		SubElement(root, 'studio').text = s.get('name', '')
+	SubElement(root, 'trailer').text = ''
+
+	thumbs = []
+	if episode.get('still_path'):
+		thumbs.append(episode['still_path'])
+	if episode.get('images'):
+		thumbs += [img['file_path'] for img in episode['images'].get('stills', []) if img.get('file_path')]
+	for t in thumbs[:2]:
+		SubElement(root, 'thumb', aspect='thumb', preview=f"https://image.tmdb.org/t/p/w780{t}").text = f"https://image.tmdb.org/t/p/original{t}"
+
+	resume = SubElement(root, 'resume')
+	SubElement(resume, 'position').text = '0.000000'
+	SubElement(resume, 'total').text = '0.000000'
+	SubElement(root, 'dateadded').text = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+	cast = episode.get('guest_stars', []) or episode.get('credits', {}).get('cast', [])
+	for idx, actor in enumerate(cast):
+		actor_el = SubElement(root, 'actor')
+		SubElement(actor_el, 'name').text = actor.get('name', '')
+		SubElement(actor_el, 'role').text = actor.get('character', '')
+		SubElement(actor_el, 'order').text = str(idx)
+		if actor.get('profile_path'):
+			SubElement(actor_el, 'thumb').text = f"https://image.tmdb.org/t/p/original{actor['profile_path']}"
+
+	return '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n' + tostring(root, encoding='utf-8').decode()
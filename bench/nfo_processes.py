@@ -0,0 +1,50 @@
+"""
+Movie and episode NFO rendering in process vs nfo.render_chunk on a process pool of 1/2/4/8 workers (user-024).
+Jobs are chunked the way NfoStage sends them, the main process CPU is what is left for the fetch and writer stages.
+"""
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import _common
+import nfo
+
+EPISODES = 4000
+MOVIES = 2000
+CHUNK = 32
+DATEADDED = re.compile(r'<dateadded>[^<]*</dateadded>')
+
+
+def chunks(kind, jobs):
+	for i in range(0, len(jobs), CHUNK):
+		yield kind, jobs[i:i + CHUNK]
+
+def in_process(work):
+	return [nfo.render_chunk(kind, jobs) for kind, jobs in work]
+
+def pooled(work, workers):
+	with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context()) as pool:
+		pool.submit(int).result()
+		futures = [pool.submit(nfo.render_chunk, kind, jobs) for kind, jobs in work]
+		return [i.result() for i in futures]
+
+def timed(label, render, work):
+	wall, cpu = time.perf_counter(), time.process_time()
+	results = render(work)
+	wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+	count = sum(len(i) for i in results)
+	print('%-11s %6.2fs  %6.0f NFOs/s  main process cpu %.2fs' % (label, wall, count / wall, cpu))
+	#dateadded is the render time, the rest must match whichever way it was rendered
+	return [DATEADDED.sub('', xml) for chunk in results for xml in chunk]
+
+def main():
+	work = list(chunks('episode', _common.nfo_jobs('episode', EPISODES))) + list(chunks('movie', _common.nfo_jobs('movie', MOVIES)))
+	print('%d episode + %d movie NFOs, chunk %d, %d CPUs' % (EPISODES, MOVIES, CHUNK, os.cpu_count()))
+	expected = timed('in process', in_process, work)
+	for workers in (1, 2, 4, 8):
+		assert timed('%d worker%s' % (workers, 's' if workers > 1 else ''), lambda work: pooled(work, workers), work) == expected
+
+if __name__ == '__main__':
+	main()
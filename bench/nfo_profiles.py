@@ -0,0 +1,41 @@
+"""
+Total NFO bytes written for a synthetic 10k item library under every nfo.PROFILES entry (user-025).
+5000 movies and 250 shows of 20 episodes, each show adds its tvshow and one season NFO, on the real sized payloads of _common.tmdb_payloads.
+"""
+import copy
+import time
+
+import _common
+import nfo
+
+MOVIES = 5000
+SHOWS = 250
+EPISODES = 20
+
+
+def library(payloads):
+	#yields (kind, args) for every NFO of the library, ids are unique so no two files are the same
+	movie, = payloads['movie']
+	episode, show = payloads['episode']
+	for i in range(MOVIES):
+		yield 'movie', (dict(movie, id=i),)
+	for i in range(SHOWS):
+		show_i = copy.deepcopy(show)
+		show_i['id'] = i
+		yield 'tvshow', (show_i,)
+		yield 'season', (show_i['seasons'][1], show_i)
+		for e in range(EPISODES):
+			yield 'episode', (dict(episode, id=i * 100 + e, episode_number=e + 1), show_i)
+
+def main():
+	payloads = _common.tmdb_payloads()
+	for name, profile in nfo.PROFILES.items():
+		files = size = 0
+		start = time.perf_counter()
+		for kind, args in library(payloads):
+			size += len(nfo.RENDERERS[kind](*args, profile=profile).encode('utf-8'))
+			files += 1
+		print('%-8s %6d NFOs %11d bytes %7.1f MB  render %.2fs' % (name, files, size, size / 1e6, time.perf_counter() - start))
+
+if __name__ == '__main__':
+	main()
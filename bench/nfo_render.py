@@ -0,0 +1,42 @@
+"""
+NFOs per second of the nfo.py renderer against the ElementTree builders it replaced (user-021), on real sized TMDB payloads.
+The old builders come from the frozen copy in bench/nfo_etree.py, both outputs are checked to match before anything is timed.
+The second table turns off the old whole payload transliteration to time the XML building alone, the payloads are ASCII so the output does not change.
+"""
+import re
+import time
+
+import _common
+import nfo
+import nfo_etree
+
+SECONDS = 1.5
+DATEADDED = re.compile(r'<dateadded>[^<]*</dateadded>')
+
+
+def rate(render, args):
+	count = 0
+	start = time.perf_counter()
+	while time.perf_counter() - start < SECONDS:
+		render(*args)
+		count += 1
+	return count / (time.perf_counter() - start)
+
+def compare(payloads):
+	for kind, args in payloads.items():
+		old, new = getattr(nfo_etree, 'kodi_%s_nfo' % kind), nfo.RENDERERS[kind]
+		#dateadded is the render time, the rest must be byte for byte the same
+		assert DATEADDED.sub('', old(*args)) == DATEADDED.sub('', new(*args)), kind
+		old_rate, new_rate = rate(old, args), rate(new, args)
+		print('%-8s elementtree %7.0f/s  nfo.py %7.0f/s  x%.1f' % (kind, old_rate, new_rate, new_rate / old_rate))
+
+def main():
+	payloads = _common.tmdb_payloads()
+	print('-- end to end')
+	compare(payloads)
+	print('-- render only')
+	nfo_etree.remove_non_ascii = nfo_etree.strip_non_ascii = lambda data: data
+	compare(payloads)
+
+if __name__ == '__main__':
+	main()
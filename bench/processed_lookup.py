@@ -0,0 +1,55 @@
+"""
+PROCESSED existence checks on a 100k row table (user-006 / user-008).
+Compares the old %-formatted SELECT, the parameterized db_access statement and the in memory set db_check_exists answers from.
+"""
+import random
+import sqlite3
+import time
+
+import _common
+import db_access
+import db_schema
+
+ROWS = 100000
+LOOKUPS = 50000
+
+
+def build(conn):
+	db_schema.ensure_schema(conn, log=lambda *args: None)
+	rows = [{'id': i, 'media_type': 'TV' if i % 2 else 'MOVIE', 'tmdb_id': i, 'added': i, 'container_ext': 'mkv',
+		'title': 'Title %s' % i, 'kodi_added': 0, 'strm_path': '/lib/%s.strm' % i, 'updated': i} for i in range(ROWS)]
+	db_access.processed_upsert_many(conn, rows)
+	conn.commit()
+
+def timed(label, check, keys):
+	start = time.perf_counter()
+	hits = sum(1 for key in keys if check(*key))
+	elapsed = time.perf_counter() - start
+	print('%-14s %7.2f us per lookup  (%d hits)' % (label, elapsed / len(keys) * 1e6, hits))
+
+def main():
+	conn = sqlite3.connect(':memory:')
+	build(conn)
+	rng = random.Random(0)
+	keys = []
+	for _ in range(LOOKUPS):
+		i = rng.randrange(ROWS * 2)
+		keys.append((i, 'Title %s' % i, 'TV' if i % 2 else 'MOVIE'))
+
+	def formatted(id, title, media_type):
+		return conn.execute("SELECT * FROM PROCESSED WHERE ID = %s and title = '%s' and media_type = '%s'" % (id, title, media_type)).fetchall()
+
+	def parameterized(id, title, media_type):
+		return conn.execute(db_access.PROCESSED_EXISTS, (id, title, db_access.legacy_title(title), media_type)).fetchall()
+
+	processed_items = {(str(id), title, media_type) for id, title, media_type, updated in db_access.processed_all(conn)}
+	def in_memory(id, title, media_type):
+		return (str(id), title, media_type) in processed_items
+
+	print('PROCESSED lookups, %d rows, %d random lookups' % (ROWS, LOOKUPS))
+	timed('formatted', formatted, keys)
+	timed('parameterized', parameterized, keys)
+	timed('in memory', in_memory, keys)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,29 @@
+"""
+Memory held by 100k get_vod_streams entries as provider dicts vs records.VodEntry (user-012), measured with tracemalloc.
+"""
+import json
+import tracemalloc
+
+import _common
+import records
+from _common import provider_body
+
+ENTRIES = 100000
+
+
+def held(build, body):
+	tracemalloc.start()
+	data = build(body)
+	current = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	del data
+	return current
+
+def main():
+	body = provider_body(ENTRIES)
+	dicts = held(json.loads, body)
+	entries = held(lambda text: [records.VodEntry.from_json(i) for i in json.loads(text)], body)
+	print('%d catalog entries: %.1f MB as dicts, %.1f MB as VodEntry records' % (ENTRIES, dicts / 1e6, entries / 1e6))
+
+if __name__ == '__main__':
+	main()
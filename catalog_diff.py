@@ -0,0 +1,29 @@
+"""
+Keyed snapshots of the get_vod_streams / get_series catalogs and the diff between two of them.
+A snapshot is a dict of id -> (stamp, container_ext, tmdb), stamp is added for movies and last_modified for series.
+"""
+from records import to_int, VodEntry, SeriesEntry
+
+
+def entry_key(entry):
+	if isinstance(entry, SeriesEntry):
+		return to_int(entry.series_id)
+	return to_int(entry.stream_id)
+
+def entry_value(entry):
+	if isinstance(entry, SeriesEntry):
+		return (entry.last_modified, '', str(entry.tmdb))
+	return (entry.added, entry.container_extension or '', str(entry.tmdb))
+
+def build_snapshot(entries):
+	return {entry_key(i): entry_value(i) for i in entries}
+
+def diff_snapshots(old, new):
+	"""
+	Compare two snapshots, returns the (added, removed, changed) id sets.
+	Both sides are dicts so every lookup is a hash probe, the cost is linear in the size of the snapshots.
+	"""
+	added = new.keys() - old.keys()
+	removed = old.keys() - new.keys()
+	changed = {k for k, v in new.items() if k in old and old[k] != v}
+	return added, removed, changed
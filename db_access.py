@@ -0,0 +1,153 @@
+"""
+Parameterized SQL for the hot PROCESSED and TMDB cache queries.
+The statement text never changes between calls so sqlite3 reuses its prepared statements.
+"""
+import re
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+#db_check_exists answers from the in memory copy loaded with PROCESSED_ALL, these two single row lookups have no caller in the sync
+#they are kept as the reference point queries, tests/test_query_plans.py pins them to an index and bench/processed_lookup.py times them
+PROCESSED_EXISTS = 'SELECT 1 FROM PROCESSED WHERE id = ? AND title IN (?, ?) AND media_type = ? LIMIT 1'
+PROCESSED_UPDATED = 'SELECT updated FROM PROCESSED WHERE media_type = ? AND id = ? LIMIT 1'
+PROCESSED_ALL = 'SELECT id, title, media_type, updated FROM PROCESSED'
+PROCESSED_UPSERT = '''
+INSERT INTO PROCESSED (id, media_type, tmdb_id, added, container_ext, title, kodi_added, strm_path, updated)
+VALUES (:id, :media_type, :tmdb_id, :added, :container_ext, :title, :kodi_added, :strm_path, :updated)
+ON CONFLICT(id, title, media_type) DO UPDATE SET
+	media_type = excluded.media_type,
+	tmdb_id = excluded.tmdb_id,
+	added = excluded.added,
+	container_ext = excluded.container_ext,
+	title = excluded.title,
+	kodi_added = excluded.kodi_added,
+	strm_path = excluded.strm_path,
+	updated = excluded.updated
+'''
+
+SYNC_STATE_SELECT = 'SELECT watermark, last_full FROM SYNC_STATE WHERE media_type = ?'
+SYNC_STATE_UPSERT = '''
+INSERT INTO SYNC_STATE (media_type, watermark, last_full, updated)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(media_type) DO UPDATE SET
+	watermark = excluded.watermark,
+	last_full = excluded.last_full,
+	updated = excluded.updated
+'''
+
+SNAPSHOT_SELECT = 'SELECT id, stamp, container_ext, tmdb FROM CATALOG_SNAPSHOT WHERE media_type = ?'
+SNAPSHOT_REPLACE = 'REPLACE INTO CATALOG_SNAPSHOT (media_type, id, stamp, container_ext, tmdb) VALUES (?, ?, ?, ?, ?)'
+SNAPSHOT_DELETE = 'DELETE FROM CATALOG_SNAPSHOT WHERE media_type = ? AND id = ?'
+PROCESSED_DELETE_ID = 'DELETE FROM PROCESSED WHERE media_type = ? AND id = ?'
+PROCESSED_PATH_ID = 'SELECT strm_path FROM PROCESSED WHERE media_type = ? AND id = ?'
+PROCESSED_PATHS = 'SELECT strm_path FROM PROCESSED WHERE media_type = ?'
+
+#valid catalog rows for the PROCESSED reconcile, the index is created after the bulk insert
+TEMP_VALID_CREATE = 'CREATE TEMP TABLE temp_valid (stream_id INT, added INT, media_type TEXT)'
+TEMP_VALID_INSERT = 'INSERT INTO temp_valid (stream_id, added, media_type) VALUES (?, ?, ?)'
+TEMP_VALID_INDEX = 'CREATE INDEX temp_valid_idx ON temp_valid (stream_id, added, media_type)'
+TEMP_VALID_EXISTS = '''
+EXISTS (
+	SELECT 1 FROM temp_valid
+	WHERE temp_valid.stream_id = PROCESSED.id
+	AND temp_valid.added = PROCESSED.added
+	AND temp_valid.media_type = PROCESSED.media_type
+)
+'''
+
+#tmdb ids of series whose get_series_info failed during a reconcile, their episode rows are kept
+TEMP_FAILED_CREATE = 'CREATE TEMP TABLE temp_failed (tmdb_id INT)'
+TEMP_FAILED_INSERT = 'INSERT INTO temp_failed (tmdb_id) VALUES (?)'
+KEEP_FAILED_SERIES = " AND NOT (media_type = 'TV' AND tmdb_id IN (SELECT tmdb_id FROM temp_failed))"
+KEEP_ALL_EPISODES = " AND media_type != 'TV'"
+PROCESSED_COUNT_FILES = "SELECT media_type, COUNT(*) FROM PROCESSED WHERE media_type IN ('TV', 'MOVIE') GROUP BY media_type"
+
+#tmdb ids of series the catalog diff found removed, their episode rows and files go with them
+TEMP_REMOVED_CREATE = 'CREATE TEMP TABLE temp_removed (tmdb_id INT)'
+TEMP_REMOVED_INSERT = 'INSERT INTO temp_removed (tmdb_id) VALUES (?)'
+REMOVED_SERIES_EPISODES = " FROM PROCESSED WHERE media_type = 'TV' AND tmdb_id IN (SELECT tmdb_id FROM temp_removed)"
+
+FILE_HASH_SELECT = 'SELECT hash FROM FILE_HASH WHERE path = ?'
+FILE_HASH_REPLACE = 'REPLACE INTO FILE_HASH (path, hash) VALUES (?, ?)'
+FILE_HASH_DELETE = 'DELETE FROM FILE_HASH WHERE path = ?'
+
+CACHE_SELECT = 'SELECT cache_val, expire, cache_type, format FROM %s WHERE url = ?'
+CACHE_EXPIRE = 'SELECT expire FROM %s WHERE url = ?'
+CACHE_REPLACE = 'REPLACE INTO %s (url, cache_val, cache_type, expire, format) VALUES (?, ?, ?, ?, ?)'
+CACHE_DELETE = 'DELETE FROM %s WHERE url = ?'
+
+
+def table_name(folder):
+	#table names cannot be bound as parameters, only plain identifiers are formatted into the SQL
+	if not folder or not IDENTIFIER.match(folder):
+		raise ValueError('Invalid table name: %s' % (folder))
+	return folder
+
+def legacy_title(title):
+	#rows written before parameterized SQL had apostrophes stripped from the title
+	return str(title).replace("'", '')
+
+def processed_all(conn):
+	return conn.execute(PROCESSED_ALL)
+
+def processed_upsert(conn, data):
+	conn.execute(PROCESSED_UPSERT, data)
+
+def processed_upsert_many(conn, rows):
+	conn.executemany(PROCESSED_UPSERT, rows)
+
+def sync_state_get(conn, media_type):
+	row = conn.execute(SYNC_STATE_SELECT, (media_type,)).fetchone()
+	if row:
+		return row[0], row[1]
+	return None, 0
+
+def sync_state_set(conn, media_type, watermark, last_full, updated):
+	conn.execute(SYNC_STATE_UPSERT, (media_type, int(watermark), int(last_full), int(updated)))
+
+def snapshot_load(conn, media_type):
+	return {row[0]: (row[1], row[2], row[3]) for row in conn.execute(SNAPSHOT_SELECT, (media_type,))}
+
+def snapshot_apply(conn, media_type, snapshot, ids, removed):
+	#only the rows that changed are written, ids are the added and changed keys of snapshot
+	conn.executemany(SNAPSHOT_DELETE, ((media_type, id) for id in removed))
+	conn.executemany(SNAPSHOT_REPLACE, ((media_type, id) + snapshot[id] for id in ids))
+
+def processed_delete_ids(conn, media_type, ids):
+	conn.executemany(PROCESSED_DELETE_ID, ((media_type, id) for id in ids))
+
+def processed_paths_for_ids(conn, media_type, ids):
+	paths = []
+	for id in ids:
+		paths.extend(row[0] for row in conn.execute(PROCESSED_PATH_ID, (media_type, id)))
+	return paths
+
+def processed_paths(conn, media_type):
+	return {row[0] for row in conn.execute(PROCESSED_PATHS, (media_type,))}
+
+def file_hash_get(conn, path):
+	row = conn.execute(FILE_HASH_SELECT, (path,)).fetchone()
+	if row:
+		return row[0]
+	return None
+
+def file_hash_put_many(conn, rows):
+	conn.executemany(FILE_HASH_REPLACE, rows)
+
+def file_hash_delete_many(conn, paths):
+	conn.executemany(FILE_HASH_DELETE, ((path,) for path in paths))
+
+def cache_select(conn, folder, hashed_url):
+	return conn.execute(CACHE_SELECT % table_name(folder), (hashed_url,)).fetchone()
+
+def cache_expire(conn, folder, hashed_url):
+	row = conn.execute(CACHE_EXPIRE % table_name(folder), (hashed_url,)).fetchone()
+	if row:
+		return row[0]
+	return None
+
+def cache_replace(conn, folder, hashed_url, cache_val, cache_type, expire, cache_format):
+	conn.execute(CACHE_REPLACE % table_name(folder), (hashed_url, cache_val, cache_type, int(expire), cache_format))
+
+def cache_delete(conn, folder, hashed_url):
+	conn.execute(CACHE_DELETE % table_name(folder), (hashed_url,))
@@ -0,0 +1,128 @@
+"""
+Creates and migrates every table in the cache DB once at startup.
+PRAGMA user_version holds the number of MIGRATIONS already applied, hot path code assumes the schema exists.
+"""
+import base64
+import sqlite3
+import zlib
+
+CACHE_FORMAT = 1 #0 = base64 text, 1 = zlib compressed utf-8 in a BLOB
+CACHE_TABLES = ['TheMovieDB']
+
+
+def db_file_size(conn):
+	page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+	page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+	return page_count * page_size
+
+def create_processed(conn, log):
+	conn.execute('''
+	CREATE TABLE IF NOT EXISTS PROCESSED (
+		id INT,
+		media_type TEXT,
+		tmdb_id INT,
+		added INT,
+		container_ext TEXT,
+		title TEXT,
+		kodi_added INT,
+		strm_path TEXT,
+		updated INT,
+		UNIQUE(id, title, media_type)
+	)
+	''')
+	#TV_SHOW lookups filter on (id, media_type) and read updated, this index covers them
+	conn.execute('CREATE INDEX IF NOT EXISTS idx_processed_type_id ON PROCESSED (media_type, id, updated)')
+
+def create_cache_tables(conn, log):
+	for folder in CACHE_TABLES:
+		conn.execute('''
+		CREATE TABLE IF NOT EXISTS %s (
+			url VARCHAR PRIMARY KEY,
+			cache_val BLOB NOT NULL,
+			cache_type VARCHAR NOT NULL,
+			expire INT NOT NULL,
+			format INT NOT NULL DEFAULT 0
+		)
+		''' % (folder))
+		migrate_cache_table(conn, folder, log)
+
+def migrate_cache_table(conn, folder, log, chunk_size=500):
+	"""
+	Re-encode base64 TEXT rows (format 0) as compressed BLOB rows and log a size comparison.
+	"""
+	columns = [i[1] for i in conn.execute('PRAGMA table_info(%s)' % (folder)).fetchall()]
+	if 'format' not in columns:
+		conn.execute('ALTER TABLE %s ADD COLUMN format INT NOT NULL DEFAULT 0' % (folder))
+	rows_old = conn.execute('SELECT count(*), coalesce(sum(length(cache_val)),0) FROM %s WHERE format = 0' % (folder)).fetchone()
+	if rows_old[0] == 0:
+		return None
+	conn.commit()
+	size_before = db_file_size(conn)
+	log('Migrating %s cache rows in %s to format %s' % (rows_old[0], folder, CACHE_FORMAT))
+	while True:
+		rows = conn.execute('SELECT url, cache_val FROM %s WHERE format = 0 LIMIT %s' % (folder, int(chunk_size))).fetchall()
+		if len(rows) == 0:
+			break
+		migrated = []
+		for url, cache_val in rows:
+			try: migrated.append((sqlite3.Binary(zlib.compress(base64.b64decode(cache_val), 6)), CACHE_FORMAT, url))
+			except: conn.execute('DELETE FROM %s WHERE url = ?' % (folder), (url,))
+		conn.executemany('UPDATE %s SET cache_val = ?, format = ? WHERE url = ?' % (folder), migrated)
+		conn.commit()
+	rows_new = conn.execute('SELECT coalesce(sum(length(cache_val)),0) FROM %s WHERE format = %s' % (folder, CACHE_FORMAT)).fetchone()
+	conn.execute('VACUUM')
+	size_after = db_file_size(conn)
+	report = {'rows': rows_old[0], 'payload_bytes_before': rows_old[1], 'payload_bytes_after': rows_new[0], 'db_bytes_before': size_before, 'db_bytes_after': size_after}
+	log('Cache migration %s: payload %s -> %s bytes, db file %s -> %s bytes' % (folder, rows_old[1], rows_new[0], size_before, size_after))
+	return report
+
+def create_sync_state(conn, log):
+	#one row per media type, watermark is the newest added / last_modified seen by the last completed sync
+	conn.execute('''
+	CREATE TABLE IF NOT EXISTS SYNC_STATE (
+		media_type TEXT PRIMARY KEY,
+		watermark INT NOT NULL DEFAULT 0,
+		last_full INT NOT NULL DEFAULT 0,
+		updated INT NOT NULL DEFAULT 0
+	)
+	''')
+
+def create_catalog_snapshot(conn, log):
+	#last seen state of the provider catalogs, keyed the same way as catalog_diff snapshots
+	conn.execute('''
+	CREATE TABLE IF NOT EXISTS CATALOG_SNAPSHOT (
+		media_type TEXT NOT NULL,
+		id INT NOT NULL,
+		stamp INT NOT NULL,
+		container_ext TEXT NOT NULL DEFAULT '',
+		tmdb TEXT NOT NULL DEFAULT '',
+		PRIMARY KEY (media_type, id)
+	) WITHOUT ROWID
+	''')
+
+def create_file_hash(conn, log):
+	#content hash of every STRM/NFO file written, used to skip rewriting identical files
+	conn.execute('''
+	CREATE TABLE IF NOT EXISTS FILE_HASH (
+		path TEXT PRIMARY KEY,
+		hash TEXT NOT NULL
+	) WITHOUT ROWID
+	''')
+
+#append only, the position of a step in this list is its schema version
+MIGRATIONS = [
+	create_processed,
+	create_cache_tables,
+	create_sync_state,
+	create_catalog_snapshot,
+	create_file_hash,
+]
+
+def ensure_schema(conn, log=print):
+	version = conn.execute('PRAGMA user_version').fetchone()[0]
+	for step in range(version, len(MIGRATIONS)):
+		MIGRATIONS[step](conn, log)
+		conn.commit()
+		conn.execute('PRAGMA user_version = %s' % (step + 1))
+		conn.commit()
+	return len(MIGRATIONS)
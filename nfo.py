@@ -0,0 +1,455 @@
+"""
+Kodi NFO rendering without ElementTree or any Kodi module, so it can be imported on its own.
+Static fragments are built once at import and values are escaped with the xml.etree.ElementTree rules,
+the output is byte for byte what the old SubElement/tostring builders produced.
+"""
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+from unidecode import unidecode
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n'
+TMDB_ORIGINAL = 'https://image.tmdb.org/t/p/original'
+TMDB_W780 = 'https://image.tmdb.org/t/p/w780'
+
+
+@lru_cache(maxsize=8192)
+def transliterate(text):
+	#actor names, genres and networks repeat across a whole library, each distinct string is transliterated once
+	return unidecode(text)
+
+def ascii_text(value):
+	#transliterate one field as it is written, instead of cloning the whole TMDB payload through Utils.remove_non_ascii
+	if isinstance(value, str) and not value.isascii():
+		return transliterate(value)
+	return value
+
+def strip_text(value):
+	#the season NFO drops non ascii characters instead of transliterating them
+	if isinstance(value, str) and not value.isascii():
+		return ''.join(c for c in value if ord(c) < 128)
+	return value
+
+def ascii_view(value, text=ascii_text):
+	if isinstance(value, str):
+		return text(value)
+	if isinstance(value, dict):
+		return AsciiDict(value, text)
+	if isinstance(value, list):
+		return AsciiList(value, text)
+	return value
+
+class AsciiDict:
+	"""
+	Read only view of a TMDB payload dict, values are passed through text (ascii_text / strip_text) when they are read.
+	Only the fields a builder actually looks at get transliterated, nested dicts and lists are wrapped on access.
+	"""
+	__slots__ = ('data', 'text')
+
+	def __init__(self, data, text=ascii_text):
+		self.data = data
+		self.text = text
+
+	def get(self, key, default=None):
+		return ascii_view(self.data.get(key, default), self.text)
+
+	def __getitem__(self, key):
+		return ascii_view(self.data[key], self.text)
+
+	def __len__(self):
+		return len(self.data)
+
+class AsciiList:
+	__slots__ = ('data', 'text')
+
+	def __init__(self, data, text=ascii_text):
+		self.data = data
+		self.text = text
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return AsciiList(self.data[index], self.text)
+		return ascii_view(self.data[index], self.text)
+
+	def __iter__(self):
+		text = self.text
+		for i in self.data:
+			yield ascii_view(i, text)
+
+	def __len__(self):
+		return len(self.data)
+
+def escape_text(text):
+	if not isinstance(text, str):
+		raise TypeError('cannot serialize %r (type %s)' % (text, type(text).__name__))
+	if '&' in text:
+		text = text.replace('&', '&amp;')
+	if '<' in text:
+		text = text.replace('<', '&lt;')
+	if '>' in text:
+		text = text.replace('>', '&gt;')
+	return text
+
+def escape_attrib(text):
+	text = escape_text(text)
+	if '"' in text:
+		text = text.replace('"', '&quot;')
+	if '\r' in text:
+		text = text.replace('\r', '&#13;')
+	if '\n' in text:
+		text = text.replace('\n', '&#10;')
+	if '\t' in text:
+		text = text.replace('\t', '&#09;')
+	return text
+
+def attrib(*pairs):
+	return ''.join(' %s="%s"' % (k, escape_attrib(v)) for k, v in pairs)
+
+def leaf(tag, text, attrs=''):
+	#an element without children, empty text renders as <tag /> like ElementTree
+	if text:
+		return '<%s%s>%s</%s>' % (tag, attrs, escape_text(text), tag)
+	return '<%s%s />' % (tag, attrs)
+
+def rating(open_tag, value, votes):
+	return open_tag + leaf('value', value) + leaf('votes', votes) + '</rating>'
+
+def image(tag, path, preview_base, *pairs):
+	return leaf(tag, TMDB_ORIGINAL + path, attrib(*pairs, ('preview', preview_base + path)))
+
+def actors(cast):
+	parts = []
+	for idx, actor in enumerate(cast):
+		parts.append('<actor>')
+		parts.append(leaf('name', actor.get('name', '')))
+		parts.append(leaf('role', actor.get('character', '')))
+		parts.append(leaf('order', str(idx)))
+		if actor.get('profile_path'):
+			parts.append(leaf('thumb', TMDB_ORIGINAL + actor['profile_path']))
+		parts.append('</actor>')
+	return ''.join(parts)
+
+def crew(members, profile):
+	writers = [leaf('credits', w.get('name', '')) for w in members if w.get('job', '').lower() == 'writer']
+	directors = [leaf('director', d.get('name', '')) for d in members if d.get('job', '').lower() == 'director']
+	return ''.join(cap(writers, profile.crew)) + ''.join(cap(directors, profile.crew))
+
+def date_added():
+	return leaf('dateadded', datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+
+def cap(items, limit):
+	return items if limit is None else items[:limit]
+
+def ratings(profile, *entries):
+	#entries are (open_tag, value, votes), slim profiles drop the ones without a value and an empty <ratings>
+	if not profile.empty_ratings:
+		entries = [i for i in entries if i[1]]
+		if not entries:
+			return ''
+	return '<ratings>' + ''.join(rating(*i) for i in entries) + '</ratings>'
+
+def ids_only(root, ids):
+	return XML_DECLARATION + '<%s>%s</%s>' % (root, ''.join(ids), root)
+
+#cast / crew are the max actors and max writers / directors, fanart the max fanart images (0 drops the element), None keeps everything
+#empty_ratings keeps rating blocks without a value, ids_only writes nothing but the uniqueid elements
+Profile = namedtuple('Profile', 'cast crew fanart empty_ratings ids_only')
+PROFILES = {
+	'full': Profile(cast=None, crew=None, fanart=None, empty_ratings=True, ids_only=False),
+	'standard': Profile(cast=15, crew=5, fanart=1, empty_ratings=False, ids_only=False),
+	'minimal': Profile(cast=5, crew=1, fanart=0, empty_ratings=False, ids_only=False),
+	'ids': Profile(cast=None, crew=None, fanart=None, empty_ratings=False, ids_only=True),
+}
+FULL = PROFILES['full']
+
+RATING_IMDB_DEFAULT = '<rating name="imdb" max="10" default="true">'
+RATING_THEMOVIEDB = '<rating name="themoviedb" max="10">'
+RATING_TMDB = '<rating name="tmdb" max="10">'
+RATING_TMDB_DEFAULT = '<rating name="tmdb" max="10" default="true">'
+RATING_TRAKT = '<rating name="trakt" max="10">'
+RESUME = '<resume><position>0.000000</position><total>0.000000</total></resume>'
+UNIQUEID_IMDB = attrib(('type', 'imdb'))
+UNIQUEID_TMDB = attrib(('type', 'tmdb'), ('default', 'true'))
+UNIQUEID_TVDB = attrib(('type', 'tvdb'))
+
+
+def kodi_movie_nfo(meta, profile=FULL):
+	meta = AsciiDict(meta)
+	imdb_id = meta.get('external_ids', {}).get('imdb_id')
+	ids = []
+	if imdb_id:
+		ids.append(leaf('uniqueid', imdb_id, UNIQUEID_IMDB))
+	ids.append(leaf('uniqueid', str(meta.get('id', '')), UNIQUEID_TMDB))
+	if profile.ids_only:
+		return ids_only('movie', ids)
+
+	out = ['<movie>']
+	out.append(leaf('title', meta.get('title', '')))
+	out.append(leaf('originaltitle', meta.get('original_title', meta.get('title', ''))))
+
+	sorttitle = meta.get('title', '')
+	if meta.get('belongs_to_collection'):
+		sorttitle = meta['belongs_to_collection'].get('name', sorttitle)
+	out.append(leaf('sorttitle', sorttitle))
+
+	vote_average, vote_count = str(meta.get('vote_average', '')), str(meta.get('vote_count', ''))
+	entries = [(RATING_THEMOVIEDB, vote_average, vote_count), (RATING_TRAKT, '', '')]
+	if imdb_id:
+		entries.insert(0, (RATING_IMDB_DEFAULT, vote_average, vote_count))
+	out.append(ratings(profile, *entries))
+
+	out.append(leaf('userrating', str(meta.get('vote_average', ''))))
+	out.append('<top250>0</top250><outline />')
+	out.append(leaf('plot', meta.get('overview', '')))
+	out.append(leaf('tagline', meta.get('tagline', '')))
+	out.append(leaf('runtime', str(meta.get('runtime', ''))))
+
+	poster_path = meta.get('poster_path')
+	backdrop_path = meta.get('backdrop_path')
+	if poster_path:
+		out.append(image('thumb', poster_path, TMDB_ORIGINAL, ('aspect', 'poster')))
+	if backdrop_path:
+		out.append(image('thumb', backdrop_path, TMDB_ORIGINAL, ('aspect', 'landscape')))
+		if profile.fanart != 0:
+			out.append('<fanart>' + image('thumb', backdrop_path, TMDB_W780) + '</fanart>')
+
+	mpaa = ''
+	for rel in meta.get('release_dates', {}).get('results', []):
+		if rel.get('iso_3166_1') == 'US':
+			for r in rel.get('release_dates', []):
+				if r.get('certification'):
+					mpaa = r.get('certification')
+					break
+	out.append(leaf('mpaa', mpaa))
+	out.append('<playcount>0</playcount><lastplayed />')
+	out.append(leaf('id', str(meta.get('id', ''))))
+	out.extend(ids)
+
+	for g in meta.get('genres', []):
+		out.append(leaf('genre', g.get('name', '')))
+	for c in meta.get('production_countries', []):
+		out.append(leaf('country', c.get('name', '')))
+
+	if meta.get('belongs_to_collection'):
+		out.append('<set>' + leaf('name', meta['belongs_to_collection'].get('name', '')) + '<overview /></set>')
+
+	out.append(crew(meta.get('credits', {}).get('crew', []), profile))
+
+	out.append(leaf('premiered', meta.get('release_date', '')))
+	out.append(leaf('year', (meta.get('release_date') or '')[:4]))
+	out.append('<status /><code /><aired />')
+
+	for s in meta.get('production_companies', []):
+		out.append(leaf('studio', s.get('name', '')))
+	out.append('<trailer />')
+	out.append(actors(cap(meta.get('credits', {}).get('cast', []), profile.cast)))
+	out.append(RESUME)
+	out.append(date_added())
+	out.append('</movie>')
+	return XML_DECLARATION + ''.join(out)
+
+def uniqueids(imdb_id, tmdb_id, tvdb_id):
+	ids = []
+	if imdb_id:
+		ids.append(leaf('uniqueid', imdb_id, UNIQUEID_IMDB))
+	if tmdb_id:
+		ids.append(leaf('uniqueid', str(tmdb_id), UNIQUEID_TMDB))
+	if tvdb_id:
+		ids.append(leaf('uniqueid', str(tvdb_id), UNIQUEID_TVDB))
+	return ids
+
+def kodi_tvshow_nfo(meta, profile=FULL):
+	meta = AsciiDict(meta)
+	imdb_id = meta.get('external_ids', {}).get('imdb_id')
+	tvdb_id = meta.get('external_ids', {}).get('tvdb_id')
+	tmdb_id = meta.get('id')
+	ids = uniqueids(imdb_id, tmdb_id, tvdb_id)
+	if profile.ids_only:
+		return ids_only('tvshow', ids)
+
+	out = ['<tvshow>']
+	out.append(leaf('title', meta.get('name', '')))
+	out.append(leaf('originaltitle', meta.get('original_name', meta.get('name', ''))))
+	out.append(leaf('showtitle', meta.get('name', '')))
+
+	out.append(ratings(profile, (RATING_IMDB_DEFAULT, '', ''), (RATING_TMDB, str(meta.get('vote_average', '')), str(meta.get('vote_count', ''))), (RATING_TRAKT, '', '')))
+
+	out.append(leaf('userrating', str(meta.get('vote_average', ''))))
+	out.append('<top250>0</top250>')
+	out.append(leaf('season', str(meta.get('number_of_seasons', ''))))
+	out.append(leaf('episode', str(meta.get('number_of_episodes', ''))))
+	out.append('<displayseason>-1</displayseason><displayepisode>-1</displayepisode><outline />')
+	out.append(leaf('plot', meta.get('overview', '')))
+	out.append(leaf('tagline', meta.get('tagline', '')))
+	runtime = meta.get('episode_run_time', ['0'])[0] if meta.get('episode_run_time') else '0'
+	out.append(leaf('runtime', str(runtime)))
+
+	poster_path = meta.get('poster_path')
+	backdrop_path = meta.get('backdrop_path')
+	logo_path = ''
+	if meta.get('images'):
+		logos = meta['images'].get('logos', [])
+		if logos:
+			logo_path = logos[0].get('file_path', '')
+
+	if backdrop_path:
+		out.append(image('thumb', backdrop_path, TMDB_W780, ('aspect', 'landscape')))
+	if logo_path:
+		out.append(image('thumb', logo_path, TMDB_W780, ('aspect', 'logos')))
+	if poster_path:
+		out.append(image('thumb', poster_path, TMDB_W780, ('aspect', 'poster')))
+
+	for season_data in meta.get('seasons', []):
+		s_poster = season_data.get('poster_path')
+		s_num = season_data.get('season_number')
+		if s_poster and s_num is not None:
+			out.append(image('thumb', s_poster, TMDB_W780, ('season', str(s_num)), ('type', 'season'), ('aspect', 'poster')))
+
+	fanart_paths = []
+	if meta.get('images'):
+		fanart_paths = [img['file_path'] for img in meta['images'].get('backdrops', [])[:2] if img.get('file_path')]
+	elif backdrop_path:
+		fanart_paths = [backdrop_path]
+	fanart_paths = cap(fanart_paths, profile.fanart)
+	if fanart_paths:
+		out.append('<fanart>' + ''.join(image('thumb', fpath, TMDB_ORIGINAL) for fpath in fanart_paths) + '</fanart>')
+	elif profile.fanart != 0:
+		out.append('<fanart />')
+
+	mpaa = ''
+	for rel in meta.get('content_ratings', {}).get('results', []):
+		if rel.get('iso_3166_1') == 'US' and rel.get('rating'):
+			mpaa = f"US:{rel['rating']}"
+			break
+		elif rel.get('iso_3166_1') and rel.get('rating'):
+			mpaa = f"{rel['iso_3166_1']}:{rel['rating']}"
+	out.append(leaf('mpaa', mpaa))
+	out.append('<playcount>0</playcount><lastplayed />')
+	out.append(leaf('id', str(tmdb_id or '')))
+	out.extend(ids)
+
+	for g in meta.get('genres', []):
+		out.append(leaf('genre', g.get('name', '')))
+
+	premiered = meta.get('first_air_date', '')
+	out.append(leaf('premiered', premiered))
+	out.append(leaf('year', premiered[:4] if premiered else ''))
+	out.append(leaf('status', meta.get('status', '')))
+	out.append('<code /><aired />')
+
+	for s in meta.get('networks', []):
+		out.append(leaf('studio', s.get('name', '')))
+	out.append('<trailer />')
+	out.append(actors(cap(meta.get('credits', {}).get('cast', []), profile.cast)))
+
+	for season_data in meta.get('seasons', []):
+		if season_data.get('season_number') is not None and season_data.get('name'):
+			out.append(leaf('namedseason', season_data['name'], attrib(('number', str(season_data['season_number'])))))
+
+	out.append(RESUME)
+	out.append(date_added())
+	out.append('</tvshow>')
+	return XML_DECLARATION + ''.join(out)
+
+def kodi_season_nfo(season, tvshow, profile=FULL):
+	season = AsciiDict(season, strip_text)
+	tvshow = AsciiDict(tvshow, strip_text)
+	if profile.ids_only:
+		#a season has no uniqueid, it is identified by its number and the TMDB ids
+		return ids_only('season', [leaf('season', str(season.get('season_number', ''))), leaf('id', str(season.get('id', ''))), leaf('tvshowid', str(tvshow.get('id', '')))])
+
+	out = ['<season>']
+	out.append(leaf('title', f"{tvshow.get('name', '')} - {season.get('name', '')}"))
+	out.append(leaf('plot', season.get('overview', '')))
+	out.append(leaf('season', str(season.get('season_number', ''))))
+	out.append(leaf('year', (season.get('air_date') or '')[:4]))
+	out.append(leaf('id', str(season.get('id', ''))))
+	out.append(leaf('tvshowid', str(tvshow.get('id', ''))))
+
+	poster_path = season.get('poster_path')
+	if poster_path:
+		out.append(image('thumb', poster_path, TMDB_W780, ('aspect', 'poster')))
+
+	backdrops = tvshow.get('images', {}).get('backdrops', [])
+	fanart = ''.join(cap([image('thumb', backdrop['file_path'], TMDB_ORIGINAL) for backdrop in backdrops[:2] if backdrop.get('file_path')], profile.fanart))
+	if fanart:
+		out.append('<fanart>' + fanart + '</fanart>')
+	elif profile.fanart != 0:
+		out.append('<fanart />')
+
+	out.append(ratings(profile, (RATING_TMDB_DEFAULT, str(tvshow.get('vote_average', '')), str(tvshow.get('vote_count', '')))))
+
+	for genre in tvshow.get('genres', []):
+		out.append(leaf('genre', genre.get('name', '')))
+	for network in tvshow.get('networks', []):
+		out.append(leaf('studio', network.get('name', '')))
+
+	if season.get('season_number') is not None and season.get('name'):
+		out.append(leaf('namedseason', season.get('name'), attrib(('number', str(season.get('season_number'))))))
+
+	out.append(RESUME)
+	out.append(date_added())
+	out.append('</season>')
+	return XML_DECLARATION + ''.join(out)
+
+def kodi_episode_nfo(episode, tvshow, profile=FULL):
+	episode = AsciiDict(episode)
+	tvshow = AsciiDict(tvshow)
+	ids = uniqueids(episode.get('external_ids', {}).get('imdb_id'), episode.get('id'), episode.get('external_ids', {}).get('tvdb_id'))
+	if profile.ids_only:
+		return ids_only('episodedetails', ids)
+
+	out = ['<episodedetails>']
+	out.append(leaf('title', episode.get('name', '')))
+	out.append(leaf('showtitle', tvshow.get('name', '')))
+	out.append(leaf('season', str(episode.get('season_number', ''))))
+	out.append(leaf('episode', str(episode.get('episode_number', ''))))
+	out.append('<displayseason>-1</displayseason><displayepisode>-1</displayepisode>')
+	out.append(leaf('aired', episode.get('air_date', '')))
+	out.append(leaf('plot', episode.get('overview', '')))
+	out.append('<tagline />')
+	out.append(leaf('runtime', str(episode.get('runtime', ''))))
+	out.append('<mpaa /><playcount>0</playcount><lastplayed />')
+	out.append(leaf('id', str(episode.get('id', ''))))
+	out.extend(ids)
+
+	vote_average, vote_count = str(episode.get('vote_average', '')), str(episode.get('vote_count', ''))
+	out.append(ratings(profile, (RATING_IMDB_DEFAULT, vote_average, vote_count), (RATING_TMDB, vote_average, vote_count), (RATING_TRAKT, '', '')))
+	out.append('<userrating>0</userrating><top250>0</top250>')
+
+	for g in tvshow.get('genres', []):
+		out.append(leaf('genre', g.get('name', '')))
+
+	out.append(crew(episode.get('crew', []), profile))
+
+	for s in tvshow.get('networks', []):
+		out.append(leaf('studio', s.get('name', '')))
+	out.append('<trailer />')
+
+	thumbs = []
+	if episode.get('still_path'):
+		thumbs.append(episode['still_path'])
+	if episode.get('images'):
+		thumbs += [img['file_path'] for img in episode['images'].get('stills', []) if img.get('file_path')]
+	for t in thumbs[:2]:
+		out.append(image('thumb', t, TMDB_W780, ('aspect', 'thumb')))
+
+	out.append(RESUME)
+	out.append(date_added())
+	cast = episode.get('guest_stars', []) or episode.get('credits', {}).get('cast', [])
+	out.append(actors(cap(cast, profile.cast)))
+	out.append('</episodedetails>')
+	return XML_DECLARATION + ''.join(out)
+
+RENDERERS = {
+	'movie': kodi_movie_nfo,
+	'tvshow': kodi_tvshow_nfo,
+	'season': kodi_season_nfo,
+	'episode': kodi_episode_nfo,
+}
+
+def render_chunk(kind, jobs):
+	#process pool entry point, renders a chunk of argument tuples for one NFO kind and returns the XML strings in order
+	render = RENDERERS[kind]
+	return [render(*args) for args in jobs]
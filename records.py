@@ -0,0 +1,46 @@
+"""
+Slotted records for the provider catalog entries, only the fields the STRM/NFO pipeline reads are kept.
+Provider dicts are converted with from_json as soon as they are parsed.
+"""
+import attr
+
+
+def to_int(value):
+	try: return int(value)
+	except (TypeError, ValueError): return 0
+
+@attr.s(slots=True)
+class VodEntry:
+	stream_id = attr.ib()
+	name = attr.ib()
+	stream_type = attr.ib()
+	tmdb = attr.ib()
+	added = attr.ib(converter=to_int)
+	container_extension = attr.ib()
+
+	@classmethod
+	def from_json(cls, i):
+		return cls(stream_id=i.get('stream_id'), name=i.get('name') or '', stream_type=i.get('stream_type'), tmdb=i.get('tmdb') or '', added=i.get('added'), container_extension=i.get('container_extension'))
+
+@attr.s(slots=True)
+class SeriesEntry:
+	series_id = attr.ib()
+	name = attr.ib()
+	tmdb = attr.ib()
+	last_modified = attr.ib(converter=to_int)
+
+	@classmethod
+	def from_json(cls, i):
+		return cls(series_id=i.get('series_id'), name=i.get('name') or '', tmdb=i.get('tmdb') or '', last_modified=i.get('last_modified'))
+
+@attr.s(slots=True)
+class EpisodeEntry:
+	id = attr.ib()
+	title = attr.ib()
+	episode_num = attr.ib(converter=to_int)
+	added = attr.ib(converter=to_int)
+	container_extension = attr.ib()
+
+	@classmethod
+	def from_json(cls, jx):
+		return cls(id=jx.get('id'), title=jx.get('title') or '', episode_num=jx.get('episode_num'), added=jx.get('added'), container_extension=jx.get('container_extension'))
@@ -0,0 +1,58 @@
+"""
+Golden file tests for nfo.py, every case is rendered with a frozen clock and compared byte for byte with the stored output.
+The *.full.nfo files were produced by the ElementTree builders nfo.py replaced, the other profiles by nfo.py itself.
+"""
+import datetime
+import json
+import os
+
+import pytest
+
+import nfo
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'nfo')
+
+with open(os.path.join(FIXTURES, 'payloads.json'), encoding='utf-8') as f:
+	PAYLOADS = json.load(f)
+
+GOLDEN = sorted(i[:-len('.nfo')] for i in os.listdir(FIXTURES) if i.endswith('.nfo'))
+
+
+class FrozenDatetime(datetime.datetime):
+	@classmethod
+	def now(cls, tz=None):
+		return datetime.datetime(2024, 5, 6, 7, 8, 9)
+
+@pytest.fixture(autouse=True)
+def frozen_clock(monkeypatch):
+	monkeypatch.setattr(nfo, 'datetime', FrozenDatetime)
+
+def golden(name):
+	with open(os.path.join(FIXTURES, name + '.nfo'), encoding='utf-8', newline='') as f:
+		return f.read()
+
+def test_every_profile_has_golden_files():
+	for profile in nfo.PROFILES:
+		assert any(i.endswith('.' + profile) for i in GOLDEN), profile
+
+@pytest.mark.parametrize('name', GOLDEN)
+def test_render_matches_golden(name):
+	case, profile = name.rsplit('.', 1)
+	payload = PAYLOADS[case]
+	assert nfo.RENDERERS[payload['kind']](*payload['args'], profile=nfo.PROFILES[profile]) == golden(name)
+
+@pytest.mark.parametrize('case', sorted(PAYLOADS))
+def test_full_is_the_default_profile(case):
+	payload = PAYLOADS[case]
+	assert nfo.RENDERERS[payload['kind']](*payload['args']) == golden(case + '.full')
+
+def test_render_chunk_matches_renderers():
+	payload = PAYLOADS['episode']
+	jobs = [tuple(payload['args']), tuple(payload['args']) + (nfo.PROFILES['minimal'],)]
+	assert nfo.render_chunk('episode', jobs) == [golden('episode.full'), golden('episode.minimal')]
+
+def test_render_leaves_payload_untouched():
+	payload = PAYLOADS['movie']
+	before = json.dumps(payload, sort_keys=True)
+	nfo.RENDERERS['movie'](*payload['args'])
+	assert json.dumps(payload, sort_keys=True) == before
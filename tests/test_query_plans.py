@@ -0,0 +1,42 @@
+"""
+Every hot PROCESSED query has to be answered from an index, EXPLAIN QUERY PLAN on a freshly migrated schema pins that.
+"""
+import sqlite3
+
+import pytest
+
+import db_access
+import db_schema
+
+
+@pytest.fixture
+def conn():
+	conn = sqlite3.connect(':memory:')
+	db_schema.ensure_schema(conn, log=lambda *args: None)
+	yield conn
+	conn.close()
+
+def plan(conn, sql, params=()):
+	return [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+def uses_index(detail, table):
+	return detail.startswith('SEARCH %s ' % table) and 'INDEX' in detail
+
+@pytest.mark.parametrize('sql, params', [
+	(db_access.PROCESSED_EXISTS, (1, 'Title', 'Title', 'MOVIE')),
+	(db_access.PROCESSED_UPDATED, ('TV_SHOW', 1)),
+	(db_access.PROCESSED_PATH_ID, ('MOVIE', 1)),
+	(db_access.PROCESSED_DELETE_ID, ('MOVIE', 1)),
+])
+def test_processed_lookup_uses_index(conn, sql, params):
+	details = plan(conn, sql, params)
+	assert any(uses_index(i, 'PROCESSED') for i in details), details
+	assert not any(i.startswith('SCAN PROCESSED') for i in details), details
+
+def test_temp_valid_probe_uses_index(conn):
+	conn.execute(db_access.TEMP_VALID_CREATE)
+	conn.execute(db_access.TEMP_VALID_INDEX)
+	#the outer PROCESSED scan is the point of the reconcile, the correlated probe per row must not scan temp_valid
+	details = plan(conn, 'SELECT strm_path FROM PROCESSED WHERE NOT' + db_access.TEMP_VALID_EXISTS)
+	assert any(uses_index(i, 'temp_valid') for i in details), details
+	assert not any(i.startswith('SCAN temp_valid') for i in details), details